@@ -0,0 +1,49 @@
+"""
+Times the admixture pair sampler against the retry-loop sampler it replaced (kept in the tests as the reference
+distribution), per draw, to show the retry tail: python3 benchmarks/admixture_sampler.py [num_draws]
+"""
+
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [repo_dir, os.path.join(repo_dir, "tests")]
+
+from pipeline_modules import generate_random_tpl  # noqa: E402
+from test_admixture_sampler import old_admix_source_and_sink  # noqa: E402
+
+
+def time_draws(sampler, ghost_present, number_of_populations, num_draws):
+    timings = np.empty(num_draws)
+    for draw in range(num_draws):
+        start = time.perf_counter()
+        sampler(ghost_present, number_of_populations)
+        timings[draw] = time.perf_counter() - start
+    return timings * 1e6
+
+
+def main(arguments):
+    num_draws = int(arguments[0]) if arguments else 20000
+    random.seed(1)
+    print("demes\tghost\tsampler\tmedian_us\tp99_us\tp99.9_us\tmax_us")
+    for number_of_populations in [3, 5, 10, 20]:
+        for ghost_present in [False, True]:
+            for name, sampler in [
+                ("old", old_admix_source_and_sink),
+                ("new", generate_random_tpl.get_admix_source_and_sink),
+            ]:
+                timings = time_draws(
+                    sampler, ghost_present, number_of_populations, num_draws
+                )
+                median, p99, p999 = np.percentile(timings, [50, 99, 99.9])
+                print(
+                    f"{number_of_populations}\t{ghost_present}\t{name}\t{median:.1f}\t{p99:.1f}\t{p999:.1f}\t{timings.max():.1f}"
+                )
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
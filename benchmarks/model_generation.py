@@ -0,0 +1,73 @@
+"""
+Measures how many random models (tpl and est lines, in memory) are generated per second for a range of deme
+counts, with the sequential and the batch topology sampler:
+python3 benchmarks/model_generation.py [num_pops ...]
+"""
+
+import os
+import random
+import sys
+import time
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repo_dir)
+
+from pipeline_modules import (  # noqa: E402
+    batch_random_tpl,
+    generate_random_est,
+    generate_random_tpl,
+)
+
+MODEL_PARAMS = {
+    "mutation_rate_dist": {"min": 1.29e-08, "max": 1.29e-08, "type": "unif"},
+    "effective_pop_size_dist": {"min": 10000, "max": 10000, "type": "unif"},
+    "migration_dist": {"min": 0.029, "max": 0.029, "type": "unif"},
+    "time_dist": {"min": 10.0, "max": 1.0e6, "type": "unif"},
+    "max_time_between_events": 1000,
+}
+MIN_SECONDS = 2.0
+
+
+def time_models(get_models):
+    # generate models until MIN_SECONDS have passed, returns models per second
+    num_models = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < MIN_SECONDS:
+        num_models += get_models()
+    return num_models / (time.perf_counter() - start)
+
+
+def main(arguments):
+    deme_counts = [int(argument) for argument in arguments] or [3, 10, 20, 50]
+    random.seed(1)
+    print("demes\tsampler\tmodels_per_s")
+    for num_pops in deme_counts:
+        sample_sizes = [10] * num_pops
+
+        def get_sequential_model():
+            tpl_lines = generate_random_tpl.get_random_tpl_lines(
+                num_pops, sample_sizes, max_admix_events=2, max_bottlenecks=2
+            )
+            generate_random_est.get_random_est_lines(tpl_lines, **MODEL_PARAMS)
+            return 1
+
+        def get_batch_models(batch_size=500):
+            for tpl_lines in batch_random_tpl.get_random_tpl_lines_batch(
+                num_pops,
+                sample_sizes,
+                batch_size,
+                max_admix_events=2,
+                max_bottlenecks=2,
+            ):
+                generate_random_est.get_random_est_lines(tpl_lines, **MODEL_PARAMS)
+            return batch_size
+
+        for name, get_models in [
+            ("sequential", get_sequential_model),
+            ("batch", get_batch_models),
+        ]:
+            print(f"{num_pops}\t{name}\t{time_models(get_models):.0f}", flush=True)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -4,16 +4,37 @@ This file is the only file run exclusively by the user.
 Takes in a .yml file and gives the user x number of random tpl's & est's.
 
 Example usage: python3 coalminer.py input.yml
+Sweep usage: python3 coalminer.py sweep configs/*.yml
 """
 
+import argparse
+import contextlib
+import glob
+import hashlib
+import itertools
+import json
+import multiprocessing
 import os
+import random
 import sys
 
 from pipeline_modules import (
     generate_random_tpl,
+    batch_random_tpl,
     generate_random_est,
+    draw_est_priors,
+    job_batches,
+    derive_obs_files,
+    prescreen_models,
+    warm_start_priors,
+    run_fastsimcoal,
+    screen_models,
+    bootstrap_models,
 )
-from utilities import get_user_params_from_yaml  # type: ignore
+from utilities import get_user_params_from_yaml, model_catalog, topology_sketch  # type: ignore
+
+# .obs file contents, read once per process and shared by every model (and every config of a sweep)
+obs_file_cache = {}
 
 
 def execute_command(command):
@@ -24,73 +45,571 @@ def create_directory(dir_path):
     os.makedirs(dir_path, exist_ok=True)
 
 
-def random_model_setup(cur_run, output_dir):
-    # make directory
-    output_folder_name = os.path.join(output_dir, f"random_model_{cur_run}")
-    create_directory(output_folder_name)
+def map_tasks(pool, function, tasks, chunk_size=10000, tasks_per_worker_chunk=64):
+    # run tasks in order, on the worker pool if there is one
+    if pool is None:
+        yield from map(function, tasks)
+        return
 
-    # copy SFS into new dir
+    # feed the pool in chunks, so that huge runs are never queued in memory all at once
+    tasks = iter(tasks)
+    while chunk := list(itertools.islice(tasks, chunk_size)):
+        yield from pool.imap(function, chunk, chunksize=tasks_per_worker_chunk)
+
+
+def get_obs_file_paths(user_params):
     # Check if OBS_FILES is specified in the YAML, otherwise use the old wildcard method
     if "OBS_FILES" in user_params and user_params["OBS_FILES"]:
-        # Copy each specified .obs file
-        for obs_file in user_params["OBS_FILES"]:
-            obs_file_path = os.path.expanduser(obs_file)  # Handle ~ in paths
-            if os.path.exists(obs_file_path):
-                os.system(f"cp {obs_file_path} {output_folder_name}")
-            else:
-                print(f"Warning: .obs file not found: {obs_file_path}")
+        obs_file_paths = user_params["OBS_FILES"]
     else:
         # Fallback to old behavior (assuming the .obs files are in the CoalMiner directory)
-        os.system(f"cp {user_params['INPUT_PREFIX']}*.obs {output_folder_name}")
+        obs_file_paths = sorted(glob.glob(f"{user_params['INPUT_PREFIX']}*.obs"))
+    return [
+        os.path.abspath(os.path.expanduser(obs_file_path))  # Handle ~ in paths
+        for obs_file_path in obs_file_paths
+    ]
+
+
+def read_obs_file(obs_file_path):
+    if obs_file_path not in obs_file_cache:
+        with open(obs_file_path, "rb") as obs_file:
+            obs_file_cache[obs_file_path] = obs_file.read()
+    return obs_file_cache[obs_file_path]
+
+
+def random_model_setup(cur_run, output_dir, obs_file_paths):
+    # make directory
+    output_folder_name = os.path.join(output_dir, f"random_model_{cur_run}")
+    create_directory(output_folder_name)
+
+    # copy SFS into new dir
+    for obs_file_path in obs_file_paths:
+        if os.path.exists(obs_file_path):
+            with open(
+                os.path.join(output_folder_name, os.path.basename(obs_file_path)), "wb"
+            ) as obs_file:
+                obs_file.write(read_obs_file(obs_file_path))
+        else:
+            print(f"Warning: .obs file not found: {obs_file_path}")
+
+    return output_folder_name
+
+
+def derive_obs_from_multidimensional_sfs(user_params, output_dir):
+    # find the multidimensional SFS among the user's .obs files
+    obs_files = user_params.get("OBS_FILES") or glob.glob(
+        f"{user_params['INPUT_PREFIX']}*.obs"
+    )
+    multidimensional_obs_files = [
+        obs_file
+        for obs_file in obs_files
+        if "DSFS" in os.path.basename(obs_file) or "MSFS" in os.path.basename(obs_file)
+    ]
+    if not multidimensional_obs_files:
+        print("Error: DERIVE_OBS_FROM_DSFS requires a *_DSFS.obs or *_MSFS.obs file")
+        sys.exit(1)
+    multidimensional_obs_file = os.path.abspath(
+        os.path.expanduser(multidimensional_obs_files[0])
+    )
+
+    # write the pairwise joint and marginal SFS once, every model gets a copy
+    derived_obs_files = derive_obs_files.derive_obs_files(
+        multidimensional_obs_file,
+        os.path.abspath(os.path.join(output_dir, "derived_obs")),
+        user_params["INPUT_PREFIX"],
+    )
+    user_params["OBS_FILES"] = [multidimensional_obs_file] + derived_obs_files
+
+
+def write_model_est(
+    model_dir, tpl_lines, user_params, warm_start_fit=None, skip_unchanged=False
+):
+    # build the est from the tpl lines, returns whether it was (re)written
+    tpl_filename = os.path.join(model_dir, f"{user_params['INPUT_PREFIX']}.tpl")
+    est_filename = os.path.join(model_dir, f"{user_params['INPUT_PREFIX']}.est")
+    pv_filename = os.path.join(model_dir, f"{user_params['INPUT_PREFIX']}.pv")
+    est_lines = generate_random_est.get_random_est_lines(
+        tpl_lines, **user_params["MODEL_PARAMS"]
+    )
+
+    # optionally start from the fitted estimates of a related model
+    initial_values = None
+    if warm_start_fit is not None:
+        warm_start_options = dict(user_params["WARM_START"])
+        warm_start_options.pop("fitted_dirs")
+        est_lines, initial_values = warm_start_priors.warm_start_est_lines(
+            est_lines, warm_start_fit, **warm_start_options
+        )
+
+    # define nested functions
+    def has_content(filepath, content):
+        # whether the file holds exactly this content (None: the file should not exist)
+        if content is None or not os.path.exists(filepath):
+            return content is None and not os.path.exists(filepath)
+        with open(filepath, "rb") as existing_file:
+            existing_hash = hashlib.sha1(existing_file.read()).digest()
+        return existing_hash == hashlib.sha1(content.encode()).digest()
 
-    # move into new dir
-    os.chdir(output_folder_name)
+    # skip the est and .pv if their content would not change
+    est_content = "\n".join(est_lines) + "\n"
+    pv_content = (
+        None
+        if initial_values is None
+        else warm_start_priors.format_initial_values(initial_values)
+    )
+    changed = not (
+        skip_unchanged
+        and has_content(est_filename, est_content)
+        and has_content(pv_filename, pv_content)
+    )
+
+    if changed:
+        generate_random_est.write_est(est_lines, est_filename)
+        if initial_values is not None:
+            warm_start_priors.write_initial_values(pv_filename, initial_values)
+        elif os.path.exists(pv_filename):
+            # the model is no longer warm-started, so fastsimcoal must not pick up stale initial values
+            os.remove(pv_filename)
+
+    # optionally draw concrete parameter sets from the est priors (e.g. for ABC), always redrawn as they also
+    # depend on the PRIOR_DRAWS options
+    if "PRIOR_DRAWS" in user_params and user_params["PRIOR_DRAWS"]:
+        draw_est_priors.generate_prior_draws(
+            tpl_filename,
+            est_filename,
+            model_index=int(model_dir.rsplit("_", 1)[1]),
+            **user_params["PRIOR_DRAWS"],
+        )
+    return changed
 
 
-def make_random_model(cur_model, output_dir):
+def make_random_model(
+    cur_model, output_dir, user_params, obs_file_paths, tpl_lines, warm_start_fit=None
+):
     # set up the random model output directory
-    random_model_setup(cur_model, output_dir)
+    model_dir = random_model_setup(cur_model, output_dir, obs_file_paths)
+
+    # write the random tpl, and generate its est
+    generate_random_tpl.write_tpl(
+        os.path.join(model_dir, f"{user_params['INPUT_PREFIX']}.tpl"), tpl_lines
+    )
+    write_model_est(model_dir, tpl_lines, user_params, warm_start_fit)
+
+    canonical_hash = model_catalog.get_canonical_model_hash(
+        model_catalog.read_tpl_features(tpl_lines)
+    )
+    return model_dir, canonical_hash
 
-    # create filenames
-    tpl_filename = f"{user_params['INPUT_PREFIX']}.tpl"
-    est_filename = f"{user_params['INPUT_PREFIX']}.est"
 
-    # Generate random tpl & est files
-    generate_random_tpl.generate_random_params(
-        tpl_filename, user_params["NUM_POPS"], user_params["SAMPLE_SIZES"]
+def refresh_model_est(model_dir, user_params, warm_start_fit=None):
+    # rewrite only the est of an existing model, from its tpl and the current priors
+    tpl_lines = generate_random_est.read_tpl(
+        os.path.join(model_dir, f"{user_params['INPUT_PREFIX']}.tpl")
     )
-    generate_random_est.generate_random_params(
-        tpl_filename, est_filename, **user_params["MODEL_PARAMS"]
+    return model_dir, write_model_est(
+        model_dir, tpl_lines, user_params, warm_start_fit, skip_unchanged=True
     )
 
-    # go back out to home directory
-    os.chdir("../..")
 
+def refresh_model_est_task(task):
+    return refresh_model_est(*task)
 
-def generate_models(user_params):
+
+def make_random_model_task(task):
+    return make_random_model(*task)
+
+
+def get_random_tpl_lines_task(task):
+    return generate_random_tpl.get_random_tpl_lines(*task)
+
+
+def get_random_tpl_lines_batch_task(task):
+    return batch_random_tpl.get_random_tpl_lines_batch(*task)
+
+
+def get_topology_key(user_params):
+    # configs with the same key draw from the same topology space, so they can share one set of topologies
+    return json.dumps(
+        [
+            user_params["NUM_POPS"],
+            user_params["SAMPLE_SIZES"],
+            user_params.get("MAX_ADMIX_EVENTS", 1),
+            user_params.get("MAX_BOTTLENECKS", 1),
+            user_params.get("NUM_RANDOM_MODELS", 100),
+            user_params.get("PRESCREEN"),
+            get_obs_file_paths(user_params) if user_params.get("PRESCREEN") else None,
+        ],
+        sort_keys=True,
+        default=str,
+    )
+
+
+def generate_topologies(user_params, output_dir, pool=None, processes=1):
+    num_random_models = user_params.get("NUM_RANDOM_MODELS", 100)
+    tpl_arguments = (
+        user_params["NUM_POPS"],
+        user_params["SAMPLE_SIZES"],
+        user_params.get("MAX_ADMIX_EVENTS", 1),
+        user_params.get("MAX_BOTTLENECKS", 1),
+    )
+    batch_size = user_params.get("TOPOLOGY_BATCH_SIZE")
+    if batch_size:
+        # draw the topologies in vectorized batches of batch_size models, with only a window of batches (two per
+        # worker process) in flight, so that memory does not grow with NUM_RANDOM_MODELS and an early stop stops
+        # the drawing
+        batch_window = 2 * (processes or os.cpu_count() or 1)
+        batch_tasks = (
+            (
+                user_params["NUM_POPS"],
+                user_params["SAMPLE_SIZES"],
+                min(batch_size, num_random_models - batch_start),
+                *tpl_arguments[2:],
+            )
+            for batch_start in range(0, num_random_models, batch_size)
+        )
+        topologies = itertools.chain.from_iterable(
+            map_tasks(
+                pool,
+                get_random_tpl_lines_batch_task,
+                batch_tasks,
+                chunk_size=batch_window,
+                tasks_per_worker_chunk=1,
+            )
+        )
+    else:
+        topologies = map_tasks(
+            pool,
+            get_random_tpl_lines_task,
+            itertools.repeat(tpl_arguments, num_random_models),
+        )
+
+    # optionally pre-screen the topologies against the observed SFS, before any are written
+    if "PRESCREEN" in user_params and user_params["PRESCREEN"] is not None:
+        create_directory(output_dir)
+        topologies = prescreen_models.prescreen_tpls(
+            list(topologies),
+            get_obs_file_paths(user_params),
+            user_params["NUM_POPS"],
+            os.path.join(output_dir, "prescreen_scores.tsv"),
+            **user_params["PRESCREEN"],
+        )
+
+    return topologies
+
+
+def generate_models(
+    user_params, pool=None, topologies=None, on_model=None, processes=1
+):
     # pull out user params
     output_dir = user_params.get(
         "OUTPUT_DIR", "output"
     )  # since output dir is an optional value
-    num_random_models = user_params.get(
-        "NUM_RANDOM_MODELS", 100
-    )  # since this is also optional
 
     # Create output directory
     create_directory(output_dir)
 
-    for i in range(1, num_random_models + 1):
-        # generate random model
-        make_random_model(cur_model=i, output_dir=output_dir)
+    # optionally derive all joint/marginal .obs files from the multidimensional SFS
+    if user_params.get("DERIVE_OBS_FROM_DSFS", False):
+        derive_obs_from_multidimensional_sfs(user_params, output_dir)
+    obs_file_paths = get_obs_file_paths(user_params)
 
+    # optionally record every model in an SQLite catalog
+    catalog_connection = None
+    if "MODEL_CATALOG" in user_params and user_params["MODEL_CATALOG"]:
+        catalog_connection = model_catalog.open_catalog(
+            os.path.abspath(os.path.expanduser(user_params["MODEL_CATALOG"]))
+        )
 
-if __name__ == "__main__":
-    # get user params
-    if len(sys.argv) < 2:
-        print("Usage: python script.py <input.yml>")
+    # topologies may be shared with other configs of a sweep
+    if topologies is None:
+        topologies = generate_topologies(user_params, output_dir, pool, processes)
+
+    # optionally index the fitted models that new models can be warm-started from
+    fitted_models = {}
+    if "WARM_START" in user_params and user_params["WARM_START"]:
+        fitted_models = warm_start_priors.read_fitted_models(
+            user_params["WARM_START"]["fitted_dirs"], user_params["INPUT_PREFIX"]
+        )
+
+    model_tasks = (
+        (
+            i,
+            output_dir,
+            user_params,
+            obs_file_paths,
+            tpl_lines,
+            (
+                warm_start_priors.find_related_fit(tpl_lines, fitted_models)
+                if fitted_models
+                else None
+            ),
+        )
+        for i, tpl_lines in enumerate(topologies, start=1)
+    )
+    # optionally track how many distinct topologies have been drawn, in fixed memory
+    saturation = user_params.get("SATURATION")
+    chunk_size = 10000
+    if saturation is not None:
+        sketch = topology_sketch.new_sketch(saturation.get("precision", 14))
+        batch_size = saturation.get("batch_size", 10000)
+        min_novelty = saturation.get("min_novelty")
+        chunk_size = batch_size  # so that no models are in flight when stopping early
+        distinct_models = 0.0
+        batches_below_min_novelty = 0
+
+    # define nested functions
+    def report_saturation(num_models, num_batch_models):
+        # the fraction of new topologies in the last num_batch_models models
+        nonlocal distinct_models
+        batch_distinct_models = topology_sketch.estimate_distinct(sketch)
+        novelty = min(
+            max(batch_distinct_models - distinct_models, 0) / num_batch_models, 1.0
+        )
+        distinct_models = batch_distinct_models
+        saturation_file.write(f"{num_models}\t{distinct_models:.0f}\t{novelty:.4f}\n")
+        saturation_file.flush()
+        print(
+            f"{num_models} models, ~{distinct_models:.0f} distinct topologies, "
+            f"{novelty:.1%} new in the last {num_batch_models}"
+        )
+        return novelty
+
+    num_models = 0
+    with contextlib.ExitStack() as exit_stack:
+        if saturation is not None:
+            saturation_file = exit_stack.enter_context(
+                open(os.path.join(output_dir, "saturation.tsv"), "w")
+            )
+            saturation_file.write("models\tdistinct_estimate\tbatch_novelty\n")
+
+        for i, (model_dir, canonical_hash) in enumerate(
+            map_tasks(pool, make_random_model_task, model_tasks, chunk_size), start=1
+        ):
+            num_models = i
+            if on_model is not None:
+                on_model(model_dir, canonical_hash)
+
+            # record the model's features in the catalog
+            if catalog_connection is not None:
+                model_catalog.add_model(
+                    catalog_connection, model_dir, user_params["INPUT_PREFIX"]
+                )
+                if i % 1000 == 0:
+                    catalog_connection.commit()
+
+            # report the fraction of new topologies in every batch
+            if saturation is not None:
+                topology_sketch.add_to_sketch(sketch, canonical_hash)
+                if i % batch_size == 0:
+                    novelty = report_saturation(i, batch_size)
+
+                    # optionally stop once new draws rarely produce new topologies
+                    if min_novelty is not None and novelty < min_novelty:
+                        batches_below_min_novelty += 1
+                        if batches_below_min_novelty >= saturation.get("patience", 1):
+                            print(
+                                f"Stopping early: fewer than {min_novelty:.1%} new topologies per batch"
+                            )
+                            break
+                    else:
+                        batches_below_min_novelty = 0
+        else:
+            # the last batch may be smaller
+            if saturation is not None and num_models % batch_size:
+                report_saturation(num_models, num_models % batch_size)
+
+    if catalog_connection is not None:
+        catalog_connection.commit()
+        catalog_connection.close()
+
+    # optionally pack the models into cost-balanced job batches for a cluster
+    if "JOB_BATCHES" in user_params and user_params["JOB_BATCHES"] is not None:
+        job_batches.write_job_batches(
+            output_dir, user_params["INPUT_PREFIX"], **user_params["JOB_BATCHES"]
+        )
+
+    return num_models
+
+
+def refresh_models(user_params, pool=None):
+    output_dir = user_params.get("OUTPUT_DIR", "output")
+    model_dirs = run_fastsimcoal.get_model_dirs(output_dir)
+    if not model_dirs:
+        print(f"Error: no random models found in {output_dir}")
         sys.exit(1)
-    user_input_yaml_filepath = sys.argv[1]
 
+    # optionally index the fitted models that the models can be warm-started from
+    fitted_models = {}
+    if "WARM_START" in user_params and user_params["WARM_START"]:
+        fitted_models = warm_start_priors.read_fitted_models(
+            user_params["WARM_START"]["fitted_dirs"], user_params["INPUT_PREFIX"]
+        )
+
+    def get_warm_start_fit(model_dir):
+        if not fitted_models:
+            return None
+        tpl_lines = generate_random_est.read_tpl(
+            os.path.join(model_dir, f"{user_params['INPUT_PREFIX']}.tpl")
+        )
+        return warm_start_priors.find_related_fit(tpl_lines, fitted_models)
+
+    refresh_tasks = (
+        (model_dir, user_params, get_warm_start_fit(model_dir))
+        for model_dir in model_dirs
+    )
+    refreshed_model_dirs = [
+        model_dir
+        for model_dir, refreshed in map_tasks(
+            pool, refresh_model_est_task, refresh_tasks
+        )
+        if refreshed
+    ]
+    print(
+        f"Refreshed {len(refreshed_model_dirs)} est files "
+        f"({len(model_dirs) - len(refreshed_model_dirs)} unchanged) in {output_dir}"
+    )
+    if not refreshed_model_dirs:
+        return refreshed_model_dirs
+
+    # the number of estimated parameters may have changed
+    if "MODEL_CATALOG" in user_params and user_params["MODEL_CATALOG"]:
+        catalog_connection = model_catalog.open_catalog(
+            os.path.abspath(os.path.expanduser(user_params["MODEL_CATALOG"]))
+        )
+        with catalog_connection:
+            for model_dir in refreshed_model_dirs:
+                model_catalog.add_model(
+                    catalog_connection, model_dir, user_params["INPUT_PREFIX"]
+                )
+        catalog_connection.close()
+    if "JOB_BATCHES" in user_params and user_params["JOB_BATCHES"] is not None:
+        job_batches.write_job_batches(
+            output_dir, user_params["INPUT_PREFIX"], **user_params["JOB_BATCHES"]
+        )
+
+    return refreshed_model_dirs
+
+
+def get_generated_model_dirs(output_dir):
+    model_dirs = run_fastsimcoal.get_model_dirs(output_dir)
+    if not model_dirs:
+        print(f"Error: no random models found in {output_dir}")
+        sys.exit(1)
+    return model_dirs
+
+
+def get_fastsimcoal_params(user_params, processes=None):
+    fastsimcoal_params = dict(user_params.get("FASTSIMCOAL") or {})
+    if processes:
+        fastsimcoal_params["processes"] = processes
+    return fastsimcoal_params
+
+
+def run_models(user_params, processes=None):
+    output_dir = user_params.get("OUTPUT_DIR", "output")
+    model_dirs = get_generated_model_dirs(output_dir)
+    fastsimcoal_params = get_fastsimcoal_params(user_params, processes)
+    results = run_fastsimcoal.run_model_replicates(
+        model_dirs, user_params["INPUT_PREFIX"], **fastsimcoal_params
+    )
+
+    status_counts = {}
+    for result in results:
+        status_counts[result["status"]] = status_counts.get(result["status"], 0) + 1
+    print(
+        f"Ran {len(results)} replicates of {len(model_dirs)} models in {output_dir}: "
+        + ", ".join(f"{count} {status}" for status, count in status_counts.items())
+    )
+    return results
+
+
+def screen_generated_models(user_params, processes=None):
+    output_dir = user_params.get("OUTPUT_DIR", "output")
+    model_dirs = get_generated_model_dirs(output_dir)
+
+    # the screening rounds set their own budgets and replicates
+    fastsimcoal_params = get_fastsimcoal_params(user_params, processes)
+    fastsimcoal_params.pop("arguments", None)
+    fastsimcoal_params.pop("replicates", None)
+
+    surviving_model_dirs = screen_models.screen_models(
+        model_dirs,
+        output_dir,
+        user_params["INPUT_PREFIX"],
+        fastsimcoal_params,
+        **(user_params.get("SCREENING") or {}),
+    )
+    with open(
+        os.path.join(output_dir, "screening_survivors.txt"), "w"
+    ) as survivors_file:
+        survivors_file.write("\n".join(surviving_model_dirs) + "\n")
+    print(
+        f"{len(surviving_model_dirs)} of {len(model_dirs)} models survived the screening in {output_dir}"
+    )
+    return surviving_model_dirs
+
+
+def bootstrap_top_models(user_params, processes=None, top=None):
+    output_dir = user_params.get("OUTPUT_DIR", "output")
+    model_dirs = get_generated_model_dirs(output_dir)
+
+    # the bootstrap sets its own simulation and refit arguments
+    fastsimcoal_params = get_fastsimcoal_params(user_params, processes)
+    fastsimcoal_params.pop("arguments", None)
+    fastsimcoal_params.pop("replicates", None)
+
+    bootstrap_params = dict(user_params.get("BOOTSTRAP") or {})
+    if top:
+        bootstrap_params["top"] = top
+    bootstrapped_model_dirs = bootstrap_models.bootstrap_models(
+        model_dirs,
+        output_dir,
+        user_params["INPUT_PREFIX"],
+        fastsimcoal_params,
+        **bootstrap_params,
+    )
+    print(
+        f"Bootstrapped {len(bootstrapped_model_dirs)} models in {output_dir}, "
+        f"confidence intervals in {os.path.join(output_dir, 'bootstrap_ci.tsv')}"
+    )
+    return bootstrapped_model_dirs
+
+
+def run_sweep(configs, manifest_filepath, processes):
+    # configs that draw from the same topology space share one set of topologies
+    topology_key_counts = {}
+    for _, user_params in configs:
+        topology_key = get_topology_key(user_params)
+        topology_key_counts[topology_key] = topology_key_counts.get(topology_key, 0) + 1
+    topology_cache = {}
+
+    # one worker pool (each worker reseeds, so workers draw different topologies) for all configs
+    with multiprocessing.Pool(processes, initializer=random.seed) as pool, open(
+        manifest_filepath, "w"
+    ) as manifest_file:
+        manifest_file.write("config\toutput_dir\tmodel\tcanonical_hash\n")
+        for config_name, user_params in configs:
+            output_dir = user_params.get("OUTPUT_DIR", "output")
+            topology_key = get_topology_key(user_params)
+            topologies = topology_cache.get(topology_key)
+            if topologies is None:
+                topologies = generate_topologies(
+                    user_params, output_dir, pool, processes
+                )
+                if topology_key_counts[topology_key] > 1:
+                    topologies = topology_cache[topology_key] = list(topologies)
+
+            print(f"Generating models for {config_name} in {output_dir}")
+
+            def write_manifest_line(model_dir, canonical_hash):
+                manifest_file.write(
+                    f"{config_name}\t{output_dir}\t{model_dir}\t{canonical_hash}\n"
+                )
+
+            generate_models(user_params, pool, topologies, write_manifest_line)
+
+
+def read_user_params(user_input_yaml_filepath):
     # Check if YAML file exists
     if not os.path.exists(user_input_yaml_filepath):
         print(f"Error: Input YAML file not found: {user_input_yaml_filepath}")
@@ -113,5 +632,112 @@ if __name__ == "__main__":
                 print(f"  - {missing_file}")
             sys.exit(1)
 
+    return user_params
+
+
+def main(arguments):
+    if arguments and arguments[0] == "sweep":
+        parser = argparse.ArgumentParser(
+            prog="coalminer.py sweep",
+            description="Run several configs (or a config with a SWEEP section) in one process",
+        )
+        parser.add_argument("configs", nargs="+", help="input .yml files")
+        parser.add_argument(
+            "--processes",
+            type=int,
+            default=os.cpu_count(),
+            help="number of worker processes shared by all configs",
+        )
+        parser.add_argument(
+            "--manifest",
+            default="sweep_manifest.tsv",
+            help="combined manifest of all generated models",
+        )
+        args = parser.parse_args(arguments[1:])
+
+        configs = []
+        for user_input_yaml_filepath in args.configs:
+            swept_params = get_user_params_from_yaml.expand_sweep(
+                read_user_params(user_input_yaml_filepath)
+            )
+            for i, user_params in enumerate(swept_params, start=1):
+                config_name = os.path.basename(user_input_yaml_filepath)
+                if len(swept_params) > 1:
+                    config_name += f"#{i}"
+                configs.append((config_name, user_params))
+
+        run_sweep(configs, args.manifest, args.processes)
+        return
+
+    if arguments and arguments[0] in ["run", "screen", "bootstrap"]:
+        descriptions = {
+            "run": "Run fastsimcoal replicates of the generated models",
+            "screen": "Screen the generated models with successively longer fastsimcoal fits",
+            "bootstrap": "Run parametric bootstraps of the best-ranked fitted models",
+        }
+        parser = argparse.ArgumentParser(
+            prog=f"coalminer.py {arguments[0]}",
+            description=descriptions[arguments[0]],
+        )
+        parser.add_argument("config", help="input .yml file")
+        parser.add_argument(
+            "--processes",
+            type=int,
+            help="number of replicates run at a time (defaulted to FASTSIMCOAL processes)",
+        )
+        if arguments[0] == "bootstrap":
+            parser.add_argument(
+                "--top",
+                type=int,
+                help="number of best-ranked models to bootstrap (defaulted to BOOTSTRAP top, or 1)",
+            )
+        args = parser.parse_args(arguments[1:])
+        user_params = read_user_params(args.config)
+        for swept_params in get_user_params_from_yaml.expand_sweep(user_params):
+            if arguments[0] == "bootstrap":
+                bootstrap_top_models(swept_params, args.processes, args.top)
+            elif arguments[0] == "screen":
+                screen_generated_models(swept_params, args.processes)
+            else:
+                run_models(swept_params, args.processes)
+        return
+
+    # get user params
+    if len(arguments) < 1:
+        print("Usage: python script.py <input.yml> [--refresh-est]")
+        print("       python script.py sweep <input.yml> [<input.yml> ...]")
+        sys.exit(1)
+    parser = argparse.ArgumentParser(prog="coalminer.py")
+    parser.add_argument("config", help="input .yml file")
+    parser.add_argument(
+        "--refresh-est",
+        action="store_true",
+        help="rewrite the est files of the existing models from their tpl and the current MODEL_PARAMS",
+    )
+    parser.add_argument(
+        "--processes",
+        type=int,
+        help="number of worker processes (defaulted to NUM_PROCESSES, or the number of CPUs with --refresh-est)",
+    )
+    args = parser.parse_args(arguments)
+    user_params = read_user_params(args.config)
+
     # run program
-    generate_models(user_params)
+    num_processes = args.processes or user_params.get(
+        "NUM_PROCESSES", os.cpu_count() if args.refresh_est else 1
+    )
+    pool = None
+    if num_processes > 1:
+        pool = multiprocessing.Pool(num_processes, initializer=random.seed)
+    for swept_params in get_user_params_from_yaml.expand_sweep(user_params):
+        if args.refresh_est:
+            refresh_models(swept_params, pool)
+        else:
+            generate_models(swept_params, pool, processes=num_processes)
+    if pool is not None:
+        pool.close()
+        pool.join()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,421 @@
+"""
+These functions draw the random evolutionary histories of many models at once, as NumPy arrays, with the same
+distribution as generate_random_tpl, and render them into tpl lines with the generate_random_tpl helpers
+"""
+
+import functools
+import random
+
+import numpy as np
+
+from pipeline_modules import generate_random_tpl
+
+
+@functools.lru_cache(maxsize=None)
+def get_deme_layout(number_of_populations, ghost_present, sample_sizes):
+    # everything but the migration matrices and events only depends on the demes, so it is rendered once
+    # with generate_random_tpl.get_tpl_lines and split around the parts that vary between models
+    template = generate_random_tpl.get_tpl_lines(
+        number_of_populations=number_of_populations,
+        population_effective_sizes=generate_random_tpl.get_population_effective_sizes(
+            number_of_populations, ghost_present
+        ),
+        sample_sizes=sample_sizes,
+        growth_rates=[0] * number_of_populations,
+        migration_matrices=[],
+        historical_events=[],
+    )
+    migration_header_index = template.index(
+        "//Number of migration matrices : 0 implies no migration between demes"
+    )
+    events_header_index = migration_header_index + 2
+    return (
+        generate_random_tpl.get_population_list(number_of_populations, ghost_present),
+        template[: migration_header_index + 1],
+        template[events_header_index],
+        template[events_header_index + 2 :],
+    )
+
+
+@functools.lru_cache(maxsize=100000)
+def get_migration_matrix(
+    num_pops,
+    ghost_present,
+    matrix_index,
+    migration_varies_by_matrix,
+    coalesced_populations,
+):
+    # the same matrices recur across models, so only render each one once
+    return generate_random_tpl.get_matrix_template(
+        num_pops,
+        ghost_present,
+        matrix_index=matrix_index,
+        migration_varies_by_matrix=migration_varies_by_matrix,
+        coalesced_populations=coalesced_populations,
+    )
+
+
+def draw_divergence_events(rng, num_models, number_of_populations, ghost_present):
+    # every deme but one diverges: returns the (num_models, number_of_populations - 1) source and sink demes
+    number_of_real_pops = (
+        number_of_populations - 1 if ghost_present else number_of_populations
+    )
+
+    # a uniform number of sinks (1..number_of_real_pops) is drawn from the real populations
+    number_of_sinks = rng.integers(1, number_of_real_pops + 1, num_models)
+    real_pop_ranks = np.argsort(
+        np.argsort(rng.random((num_models, number_of_real_pops)), axis=1), axis=1
+    )
+    is_sink = real_pop_ranks < number_of_sinks[:, None]
+    if ghost_present:
+        # the ghost is a source or a sink
+        is_sink = np.column_stack([is_sink, rng.random(num_models) < 0.5])
+
+    # sources diverge first, in random order, then all sinks but the last one, in random order
+    divergence_order = np.argsort(
+        rng.random((num_models, number_of_populations)) + is_sink, axis=1
+    )
+    number_of_sources = number_of_populations - is_sink.sum(axis=1)
+
+    # the sink of event t is any sink that has not diverged yet (i.e. further down the divergence order)
+    event_index = np.arange(number_of_populations - 1)
+    first_sink = np.maximum(event_index + 1, number_of_sources[:, None])
+    sink_position = first_sink + (
+        rng.random((num_models, number_of_populations - 1))
+        * (number_of_populations - first_sink)
+    ).astype(int)
+
+    sources = divergence_order[:, :-1]
+    sinks = np.take_along_axis(divergence_order, sink_position, axis=1)
+    return sources, sinks
+
+
+def draw_ghost_picked(rng, shape, number_of_populations):
+    # same process as generate_random_tpl.draw_ghost_picked, vectorized over the models without identical attempts
+    (
+        final_attempts,
+        final_cum_weights,
+        identical_probability,
+        identical_sizes,
+        identical_cum_weights,
+    ) = generate_random_tpl.get_admix_attempt_weights(number_of_populations)
+    number_of_real_pops = number_of_populations - 1
+    ghost_picked = np.zeros(shape, dtype=bool)
+    if number_of_real_pops < 2:
+        return ghost_picked
+
+    final_attempts = np.array(final_attempts, dtype=np.int64)
+    attempts = final_attempts[
+        rng.choice(
+            len(final_attempts),
+            shape,
+            p=np.diff(final_cum_weights, prepend=0) / final_cum_weights[-1],
+        )
+    ]
+    ghost_side_sizes, other_side_sizes, ghost_drawn = (
+        attempts[..., 0],
+        attempts[..., 1],
+        attempts[..., 2].astype(bool),
+    )
+    number_of_identical = rng.geometric(1 - identical_probability, shape) - 1
+
+    # without identical attempts, only the overlap of the two sides matters
+    overlap = rng.hypergeometric(
+        other_side_sizes,
+        number_of_real_pops - other_side_sizes,
+        np.maximum(ghost_side_sizes - 1, 1),
+    ) * (ghost_side_sizes > 1)
+    ghost_picked = ghost_drawn & (
+        rng.random(shape) * (ghost_side_sizes * other_side_sizes - overlap)
+        < other_side_sizes
+    )
+
+    # the few models with identical attempts are drawn one at a time
+    identical_probabilities = (
+        np.diff(identical_cum_weights, prepend=0) / identical_cum_weights[-1]
+    )
+    for index in zip(*np.nonzero(ghost_drawn & (number_of_identical > 0))):
+        ghost_picked[index] = generate_random_tpl.get_ghost_picked(
+            number_of_real_pops,
+            int(ghost_side_sizes[index]),
+            int(other_side_sizes[index]),
+            rng.choice(
+                identical_sizes, number_of_identical[index], p=identical_probabilities
+            ).tolist(),
+            random.Random(int(rng.integers(2**63))),
+        )
+    return ghost_picked
+
+
+def draw_admixture_pairs(rng, shape, number_of_populations, ghost_present):
+    # same distribution as generate_random_tpl.get_admix_source_and_sink, the ghost is the last deme
+    number_of_real_pops = (
+        number_of_populations - 1 if ghost_present else number_of_populations
+    )
+
+    # uniform over ordered pairs of distinct real populations
+    sources = rng.integers(0, max(number_of_real_pops, 1), shape)
+    sinks = rng.integers(0, max(number_of_real_pops - 1, 1), shape)
+    if number_of_real_pops >= 2:
+        sinks = sinks + (sinks >= sources)
+
+    if ghost_present:
+        ghost_is_source = rng.random(shape) < 0.5
+        ghost_picked = (number_of_real_pops < 2) | draw_ghost_picked(
+            rng, shape, number_of_populations
+        )
+        real_pops = rng.integers(0, number_of_real_pops, shape)
+        ghost = number_of_populations - 1
+        sources = np.where(
+            ghost_picked, np.where(ghost_is_source, ghost, real_pops), sources
+        )
+        sinks = np.where(
+            ghost_picked, np.where(ghost_is_source, real_pops, ghost), sinks
+        )
+    return sources, sinks
+
+
+def draw_topologies(
+    rng,
+    num_models,
+    number_of_populations,
+    ghost_present,
+    max_admix_events=1,
+    max_bottlenecks=1,
+):
+    number_of_real_pops = (
+        number_of_populations - 1 if ghost_present else number_of_populations
+    )
+    number_of_divergences = number_of_populations - 1
+
+    # migration (50% probability), varying by matrix (50% probability, if there is migration)
+    pops_should_migrate = rng.random(num_models) < 0.5
+    migration_varies_by_matrix = pops_should_migrate & (rng.random(num_models) < 0.5)
+
+    # divergence events, each resizing the new deme with 50% probability
+    div_sources, div_sinks = draw_divergence_events(
+        rng, num_models, number_of_populations, ghost_present
+    )
+    div_resized = rng.random((num_models, number_of_divergences)) < 0.5
+
+    # each admixture event and bottleneck is added with 50% probability
+    number_of_admix_events = rng.binomial(max_admix_events, 0.5, num_models)
+    if not ghost_present and number_of_real_pops < 2:
+        number_of_admix_events[:] = 0  # no two different populations to admix
+    admix_sources, admix_sinks = draw_admixture_pairs(
+        rng, (num_models, max_admix_events), number_of_populations, ghost_present
+    )
+    admix_migrants = rng.random((num_models, max_admix_events))
+    number_of_bottlenecks = rng.binomial(max_bottlenecks, 0.5, num_models)
+    bottleneck_demes = rng.integers(
+        0, number_of_populations, (num_models, max_bottlenecks)
+    )
+
+    # going back in time, a lineage ends at the divergence of its source deme (the last lineage never ends)
+    lineage_end = np.full(
+        (num_models, number_of_populations), max(number_of_divergences - 1, 0)
+    )
+    np.put_along_axis(
+        lineage_end, div_sources, np.arange(number_of_divergences)[None, :], axis=1
+    )
+
+    # admixture events and bottlenecks are placed in a random slot before the end of their lineages
+    placed_sources = np.column_stack([admix_sources, bottleneck_demes])
+    placed_sinks = np.column_stack([admix_sinks, bottleneck_demes])
+    latest_slot = np.minimum(
+        np.take_along_axis(lineage_end, placed_sources, axis=1),
+        np.take_along_axis(lineage_end, placed_sinks, axis=1),
+    )
+    placed_slots = (rng.random(latest_slot.shape) * (latest_slot + 1)).astype(int)
+
+    # ... in random order within their slot, taking the migration matrix of either divergence event around them
+    placed_order = rng.random(latest_slot.shape)
+    placed_migration_matrices = np.where(
+        pops_should_migrate[:, None] & (number_of_divergences > 0),
+        placed_slots + (rng.random(latest_slot.shape) < 0.5),
+        0,
+    )
+
+    # sort all events into a timeline: slot i holds its placed events, then divergence event i
+    placed_present = np.column_stack(
+        [
+            np.arange(max_admix_events)[None, :] < number_of_admix_events[:, None],
+            np.arange(max_bottlenecks)[None, :] < number_of_bottlenecks[:, None],
+        ]
+    )
+    timeline_keys = np.column_stack(
+        [
+            2 * np.arange(number_of_divergences)[None, :] + np.ones((num_models, 1)),
+            np.where(placed_present, 2 * placed_slots + placed_order, np.inf),
+        ]
+    )
+    timelines = np.argsort(timeline_keys, axis=1)
+    timeline_lengths = number_of_divergences + placed_present.sum(axis=1)
+
+    return {
+        "pops_should_migrate": pops_should_migrate,
+        "migration_varies_by_matrix": migration_varies_by_matrix,
+        "div_sources": div_sources,
+        "div_sinks": div_sinks,
+        "div_resized": div_resized,
+        "max_admix_events": max_admix_events,
+        "placed_sources": placed_sources,
+        "placed_sinks": placed_sinks,
+        "placed_migration_matrices": placed_migration_matrices,
+        "admix_migrants": admix_migrants,
+        "timelines": timelines,
+        "timeline_lengths": timeline_lengths,
+    }
+
+
+def render_tpl_lines(topologies, number_of_populations, ghost_present, sample_sizes):
+    population_list, tpl_head, events_header, tpl_tail = get_deme_layout(
+        number_of_populations, ghost_present, tuple(sample_sizes)
+    )
+    number_of_divergences = number_of_populations - 1
+    max_admix_events = topologies["max_admix_events"]
+
+    # plain lists are much faster to index than arrays
+    columns = {
+        name: values.tolist()
+        for name, values in topologies.items()
+        if isinstance(values, np.ndarray)
+    }
+
+    tpl_lines = []
+    for (
+        pops_should_migrate,
+        migration_varies_by_matrix,
+        div_sources,
+        div_sinks,
+        div_resized,
+        placed_sources,
+        placed_sinks,
+        placed_migration_matrices,
+        admix_migrants,
+        timeline,
+        timeline_length,
+    ) in zip(
+        columns["pops_should_migrate"],
+        columns["migration_varies_by_matrix"],
+        columns["div_sources"],
+        columns["div_sinks"],
+        columns["div_resized"],
+        columns["placed_sources"],
+        columns["placed_sinks"],
+        columns["placed_migration_matrices"],
+        columns["admix_migrants"],
+        columns["timelines"],
+        columns["timeline_lengths"],
+    ):
+        historical_events = []
+        for event_index in timeline[:timeline_length]:
+            if event_index < number_of_divergences:
+                source, sink = div_sources[event_index], div_sinks[event_index]
+                source_sink = f"{population_list[source]}{population_list[sink]}"
+                historical_events.append(
+                    f"T_DIV{source_sink}$ {source} {sink} 1 "
+                    + (f"RELANC{source_sink}$" if div_resized[event_index] else "1")
+                    + f" 0 {event_index + 1 if pops_should_migrate else 0}"
+                )
+                continue
+
+            placed_index = event_index - number_of_divergences
+            source, sink = placed_sources[placed_index], placed_sinks[placed_index]
+            source_sink = f"{population_list[source]}{population_list[sink]}"
+            migration_matrix = placed_migration_matrices[placed_index]
+            if placed_index < max_admix_events:
+                suffix = generate_random_tpl.get_event_suffix(placed_index + 1)
+                historical_events.append(
+                    f"T_ADMIX{source_sink}{suffix}$ {source} {sink} "
+                    f"{admix_migrants[placed_index]} 1 0 {migration_matrix}"
+                )
+            else:
+                # make sure that the bottleneck ends right after it starts
+                suffix = generate_random_tpl.get_event_suffix(
+                    placed_index - max_admix_events + 1
+                )
+                historical_events.append(
+                    f"T_BOT{source_sink}{suffix}$ {source} {sink} 0 RESBOT{source_sink}{suffix}$ 0 {migration_matrix}"
+                )
+                historical_events.append(
+                    f"T_BOTEND{source_sink}{suffix}$ {source} {sink} 0 RESBOTEND{source_sink}{suffix}$ 0 {migration_matrix}"
+                )
+
+        # migration stops to and from every deme that has coalesced
+        migration_matrices = []
+        if pops_should_migrate:
+            coalesced_populations = frozenset()
+            migration_matrices.extend(
+                get_migration_matrix(
+                    number_of_populations,
+                    ghost_present,
+                    0,
+                    migration_varies_by_matrix,
+                    coalesced_populations,
+                )
+            )
+            for event_index, source in enumerate(div_sources):
+                coalesced_populations = coalesced_populations | {
+                    population_list[source]
+                }
+                migration_matrices.extend(
+                    get_migration_matrix(
+                        number_of_populations,
+                        ghost_present,
+                        event_index + 1,
+                        migration_varies_by_matrix,
+                        coalesced_populations,
+                    )
+                )
+
+        # same lines as generate_random_tpl.get_tpl_lines
+        tpl_lines.append(
+            tpl_head
+            + [str(number_of_divergences + 1 if pops_should_migrate else 0)]
+            + migration_matrices
+            + [events_header, f"{len(historical_events)} historical event"]
+            + historical_events
+            + tpl_tail
+        )
+    return tpl_lines
+
+
+def get_random_tpl_lines_batch(
+    user_given_number_of_populations,
+    user_given_sample_sizes,
+    num_models,
+    max_admix_events=1,
+    max_bottlenecks=1,
+    seed=None,
+):
+    # the batch version of generate_random_tpl.get_random_tpl_lines, returns the tpl lines of num_models models
+    rng = np.random.default_rng(seed)
+
+    # determine which models have a ghost population (50% probability), and draw each group at once
+    ghost_present = rng.random(num_models) < 0.5
+    batch_tpl_lines = [None] * num_models
+    for add_ghost in [False, True]:
+        model_indices = np.flatnonzero(ghost_present == add_ghost)
+        if not len(model_indices):
+            continue
+        number_of_populations = user_given_number_of_populations + add_ghost
+        sample_sizes = (
+            user_given_sample_sizes + [0] if add_ghost else user_given_sample_sizes
+        )
+        topologies = draw_topologies(
+            rng,
+            len(model_indices),
+            number_of_populations,
+            add_ghost,
+            max_admix_events=max_admix_events,
+            max_bottlenecks=max_bottlenecks,
+        )
+        for model_index, tpl_lines in zip(
+            model_indices.tolist(),
+            render_tpl_lines(
+                topologies, number_of_populations, add_ghost, sample_sizes
+            ),
+        ):
+            batch_tpl_lines[model_index] = tpl_lines
+    return batch_tpl_lines
@@ -0,0 +1,315 @@
+"""
+These functions run parametric bootstraps of the best-ranked fitted models: the best fastsimcoal estimates of a
+model are written into a fixed-parameter .par, SFS replicates are simulated from it, and every simulated SFS is
+refitted, all on a shared pool of processes. Confidence intervals are written as soon as a model's refits end
+"""
+
+import glob
+import math
+import os
+import shlex
+
+import numpy as np
+
+from pipeline_modules import draw_est_priors, run_fastsimcoal, screen_models
+from pipeline_modules import warm_start_priors
+from utilities import model_catalog  # type: ignore
+
+
+def find_best_fit(model_dir, input_prefix):
+    # the best .bestlhoods over the model's replicate directories (or the model directory itself)
+    best_fit = None
+    for bestlhoods_filepath in glob.glob(
+        os.path.join(model_dir, "*", input_prefix, f"{input_prefix}.bestlhoods")
+    ) + glob.glob(os.path.join(model_dir, input_prefix, f"{input_prefix}.bestlhoods")):
+        if os.path.relpath(bestlhoods_filepath, model_dir).startswith(
+            "bootstrap" + os.sep
+        ):
+            continue
+        estimates, likelihood = warm_start_priors.read_bestlhoods(bestlhoods_filepath)
+        if best_fit is None or likelihood > best_fit["likelihood"]:
+            best_fit = {
+                "path": bestlhoods_filepath,
+                "likelihood": likelihood,
+                "estimates": estimates,
+            }
+    return best_fit
+
+
+def rank_fitted_models(model_dirs, input_prefix):
+    # fitted models ordered by AIC, best first
+    ranking = []
+    for model_dir in model_dirs:
+        fit = find_best_fit(model_dir, input_prefix)
+        if fit is None:
+            continue
+        num_params = model_catalog.count_est_params(
+            os.path.join(model_dir, f"{input_prefix}.est")
+        )
+        ranking.append(
+            (screen_models.get_aic(fit["likelihood"], num_params), model_dir, fit)
+        )
+    ranking.sort(key=lambda entry: entry[0])
+    return [(model_dir, fit) for _, model_dir, fit in ranking]
+
+
+def write_fixed_par(model_dir, bootstrap_dir, input_prefix, estimates):
+    # the model's tpl with every parameter fixed to its best estimate
+    simple_params, complex_params = draw_est_priors.read_est(
+        os.path.join(model_dir, f"{input_prefix}.est")
+    )
+    int_names = {param[1] for param in simple_params + complex_params if param[0]}
+    names = list(estimates)
+    values = {
+        name: np.array([round(value) if name in int_names else value], dtype=np.float64)
+        for name, value in estimates.items()
+    }
+
+    template_pieces, slots = draw_est_priors.get_par_template(
+        os.path.join(model_dir, f"{input_prefix}.tpl")
+    )
+    columns = draw_est_priors.get_par_columns(slots, names, int_names, values)
+    par_filepath = os.path.join(bootstrap_dir, f"{input_prefix}.par")
+    with open(par_filepath, "w") as par_file:
+        par_file.write(draw_est_priors.render_par(template_pieces, slots, columns, 0))
+    return par_filepath
+
+
+def setup_bootstrap_replicate(model_dir, bootstrap_dir, input_prefix, bootstrap):
+    # every simulated SFS is refitted in its own directory, linking the model's tpl/est and the simulated obs files
+    replicate_dir = os.path.join(bootstrap_dir, f"rep_{bootstrap}")
+    simulated_obs_filepaths = glob.glob(
+        os.path.join(
+            bootstrap_dir, input_prefix, f"{input_prefix}_{bootstrap}", "*.obs"
+        )
+    )
+    if not simulated_obs_filepaths:
+        return None
+
+    os.makedirs(replicate_dir, exist_ok=True)
+    shared_filepaths = [
+        os.path.join(model_dir, f"{input_prefix}.{extension}")
+        for extension in ["tpl", "est", "pv"]
+    ] + simulated_obs_filepaths
+    for filepath in shared_filepaths:
+        link_filepath = os.path.join(replicate_dir, os.path.basename(filepath))
+        if os.path.exists(filepath) and not os.path.lexists(link_filepath):
+            os.symlink(os.path.relpath(filepath, replicate_dir), link_filepath)
+    return replicate_dir
+
+
+def get_confidence_intervals(estimates, bootstrap_estimates, confidence_level):
+    # percentile intervals of every parameter over the bootstrap refits
+    tail = (1 - confidence_level) / 2
+    confidence_intervals = []
+    for name, estimate in estimates.items():
+        values = np.array(
+            [refit[name] for refit in bootstrap_estimates if name in refit],
+            dtype=np.float64,
+        )
+        if len(values):
+            lower, upper = np.quantile(values, [tail, 1 - tail])
+            mean = values.mean()
+        else:
+            lower = upper = mean = math.nan
+        confidence_intervals.append((name, estimate, mean, lower, upper, len(values)))
+    return confidence_intervals
+
+
+def write_confidence_intervals(ci_file, model_dir, confidence_intervals):
+    for name, estimate, mean, lower, upper, num_values in confidence_intervals:
+        ci_file.write(
+            "\t".join(
+                [
+                    model_dir,
+                    name.rstrip("$"),
+                    f"{estimate:g}",
+                    f"{mean:g}",
+                    f"{lower:g}",
+                    f"{upper:g}",
+                    str(num_values),
+                ]
+            )
+            + "\n"
+        )
+    ci_file.flush()
+
+
+def bootstrap_models(
+    model_dirs,
+    output_dir,
+    input_prefix,
+    fastsimcoal_params,
+    top=1,
+    num_bootstraps=100,
+    simulation_arguments="-d -s0 -x -I -q",
+    refit_arguments="-n 100000 -d -M -L 40 -q -c 1",
+    refit_replicates=1,
+    confidence_level=0.95,
+):
+    fastsimcoal_params = dict(fastsimcoal_params)
+    executable = run_fastsimcoal.resolve_executable(
+        fastsimcoal_params.pop("executable", "fsc28")
+    )
+    processes = fastsimcoal_params.pop("processes", 1)
+    ci_header = "model\tparameter\testimate\tmean\tlower\tupper\tnum_bootstraps\n"
+
+    ranking = rank_fitted_models(model_dirs, input_prefix)
+    if not ranking:
+        print(f"Error: no fitted models ({input_prefix}.bestlhoods) in {output_dir}")
+        return []
+    top_models = ranking[:top]
+
+    # simulate the SFS replicates of every top model from its best estimates
+    simulation_jobs = []
+    for model_dir, fit in top_models:
+        bootstrap_dir = os.path.join(model_dir, "bootstrap")
+        os.makedirs(bootstrap_dir, exist_ok=True)
+        write_fixed_par(model_dir, bootstrap_dir, input_prefix, fit["estimates"])
+        simulation_jobs.append(
+            {
+                "model_dir": model_dir,
+                "replicate_dir": bootstrap_dir,
+                "command": [
+                    executable,
+                    "-i",
+                    f"{input_prefix}.par",
+                    "-n",
+                    str(num_bootstraps),
+                    "-j",
+                    *shlex.split(simulation_arguments),
+                ],
+            }
+        )
+    simulation_results = run_fastsimcoal.run_replicates(
+        simulation_jobs, input_prefix, processes=processes
+    )
+
+    # set up the refits of every simulated SFS
+    refit_jobs = []
+    model_states = {}
+    replicate_states = {}
+    for (model_dir, fit), simulation_result in zip(top_models, simulation_results):
+        bootstrap_dir = simulation_result["replicate_dir"]
+        if simulation_result["status"] != "finished":
+            print(
+                f"Warning: simulating the bootstrap SFS of {model_dir} failed ({simulation_result['reason']})"
+            )
+            continue
+        model_states[model_dir] = {
+            "fit": fit,
+            "remaining": 0,
+            "bootstrap_estimates": [],
+            "estimates_file": open(
+                os.path.join(bootstrap_dir, "bootstrap_estimates.tsv"), "w"
+            ),
+        }
+        for bootstrap in range(1, num_bootstraps + 1):
+            replicate_dir = setup_bootstrap_replicate(
+                model_dir, bootstrap_dir, input_prefix, bootstrap
+            )
+            if replicate_dir is None:
+                print(
+                    f"Warning: no simulated SFS for bootstrap replicate {bootstrap} of {model_dir}"
+                )
+                continue
+            model_states[model_dir]["remaining"] += 1
+            replicate_states[replicate_dir] = {
+                "model_dir": model_dir,
+                "bootstrap": bootstrap,
+                "remaining": refit_replicates,
+                "best_fit": None,
+            }
+            for refit in range(1, refit_replicates + 1):
+                refit_dir = run_fastsimcoal.setup_replicate_dir(
+                    replicate_dir, input_prefix, f"run_{refit}"
+                )
+                refit_jobs.append(
+                    {
+                        "model_dir": replicate_dir,
+                        "replicate_dir": refit_dir,
+                        "command": run_fastsimcoal.get_fastsimcoal_command(
+                            refit_dir, input_prefix, executable, refit_arguments
+                        ),
+                    }
+                )
+
+    ci_filepath = os.path.join(output_dir, "bootstrap_ci.tsv")
+    with open(ci_filepath, "w") as ci_file:
+        ci_file.write(ci_header)
+
+    # define nested functions
+    def finish_model(model_dir):
+        state = model_states[model_dir]
+        state["estimates_file"].close()
+        confidence_intervals = get_confidence_intervals(
+            state["fit"]["estimates"], state["bootstrap_estimates"], confidence_level
+        )
+        with open(
+            os.path.join(model_dir, "bootstrap", "bootstrap_ci.tsv"), "w"
+        ) as model_ci_file:
+            model_ci_file.write(ci_header)
+            write_confidence_intervals(model_ci_file, model_dir, confidence_intervals)
+        with open(ci_filepath, "a") as ci_file:
+            write_confidence_intervals(ci_file, model_dir, confidence_intervals)
+
+    def finish_refit(result):
+        # keep the best refit of every bootstrap replicate, and stream it out once all its refits have ended
+        # (rows are in the order the replicates end, the replicate column gives their number)
+        replicate_state = replicate_states[result["model_dir"]]
+        replicate_state["remaining"] -= 1
+        if result["status"] == "finished":
+            bestlhoods_filepath = os.path.join(
+                result["replicate_dir"], input_prefix, f"{input_prefix}.bestlhoods"
+            )
+            if os.path.exists(bestlhoods_filepath):
+                estimates, likelihood = warm_start_priors.read_bestlhoods(
+                    bestlhoods_filepath
+                )
+                best_fit = replicate_state["best_fit"]
+                if best_fit is None or likelihood > best_fit[1]:
+                    replicate_state["best_fit"] = (estimates, likelihood)
+        if replicate_state["remaining"]:
+            return
+
+        model_dir = replicate_state["model_dir"]
+        model_state = model_states[model_dir]
+        if replicate_state["best_fit"] is not None:
+            estimates, likelihood = replicate_state["best_fit"]
+            estimates_file = model_state["estimates_file"]
+            if not model_state["bootstrap_estimates"]:
+                estimates_file.write(
+                    "\t".join(
+                        ["replicate"]
+                        + [name.rstrip("$") for name in estimates]
+                        + ["MaxEstLhood"]
+                    )
+                    + "\n"
+                )
+            estimates_file.write(
+                "\t".join(
+                    [str(replicate_state["bootstrap"])]
+                    + [f"{value:g}" for value in estimates.values()]
+                    + [f"{likelihood:g}"]
+                )
+                + "\n"
+            )
+            estimates_file.flush()
+            model_state["bootstrap_estimates"].append(estimates)
+        model_state["remaining"] -= 1
+        if not model_state["remaining"]:
+            finish_model(model_dir)
+
+    # models without any simulated SFS still get their (empty) intervals
+    for model_dir, state in model_states.items():
+        if not state["remaining"]:
+            finish_model(model_dir)
+
+    run_fastsimcoal.run_replicates(
+        refit_jobs,
+        input_prefix,
+        processes=processes,
+        on_result=finish_refit,
+        **fastsimcoal_params,
+    )
+    return [model_dir for model_dir in model_states]
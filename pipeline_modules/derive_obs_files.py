@@ -0,0 +1,99 @@
+"""
+These functions derive every pairwise joint SFS (and the 1D marginal SFS) from a multidimensional SFS (DSFS/MSFS),
+and write them in fastsimcoal's .obs format, so users only need to provide the multidimensional SFS
+"""
+
+import itertools
+import os
+
+import numpy as np
+
+
+def read_multidimensional_sfs(obs_filepath):
+    with open(obs_filepath, "r") as obs_file:
+        lines = obs_file.read().splitlines()
+
+    # the second line holds the number of demes followed by their sample sizes
+    sample_sizes = [int(size) for size in lines[1].split()[1:]]
+    values = np.array(lines[2].split(), dtype=float)
+
+    # entries are listed with the last population varying fastest
+    return sample_sizes, values.reshape([size + 1 for size in sample_sizes])
+
+
+def get_marginal_sfs(sfs, populations):
+    # sum out every other population, and order the remaining axes as requested
+    other_axes = tuple(axis for axis in range(sfs.ndim) if axis not in populations)
+    marginal = sfs.sum(axis=other_axes)
+    return np.transpose(marginal, np.argsort(np.argsort(populations)))
+
+
+def format_sfs_values(values):
+    # keep counts as integers, projected (non-integer) SFS entries as floats
+    if np.all(values == np.round(values)):
+        return values.astype(np.int64).astype(str)
+    return np.char.mod("%.10g", values)
+
+
+def write_joint_sfs(obs_filepath, joint_sfs, row_population, column_population):
+    values = format_sfs_values(joint_sfs)
+    lines = [
+        "1 observations",
+        "\t"
+        + "\t".join(f"d{column_population}_{i}" for i in range(joint_sfs.shape[1])),
+    ]
+    for i, row in enumerate(values):
+        lines.append(f"d{row_population}_{i}\t" + "\t".join(row) + "\t")
+
+    with open(obs_filepath, "w") as obs_file:
+        obs_file.write("\n".join(lines) + "\n")
+
+
+def write_marginal_sfs(obs_filepath, marginal_sfs, population):
+    lines = [
+        "1 observations",
+        "\t".join(f"d{population}_{i}" for i in range(len(marginal_sfs))),
+        "\t".join(format_sfs_values(marginal_sfs)),
+    ]
+
+    with open(obs_filepath, "w") as obs_file:
+        obs_file.write("\n".join(lines) + "\n")
+
+
+def derive_obs_files(multidimensional_obs_filepath, output_dir, input_prefix):
+    # derived (DSFS) or minor (MSFS) allele frequencies
+    sfs_type = (
+        "MAF" if "MSFS" in os.path.basename(multidimensional_obs_filepath) else "DAF"
+    )
+    sample_sizes, sfs = read_multidimensional_sfs(multidimensional_obs_filepath)
+    os.makedirs(output_dir, exist_ok=True)
+
+    derived_obs_filepaths = []
+
+    # pairwise joint SFS, e.g. hom_sap_jointDAFpop1_0.obs has pop1 as rows and pop0 as columns
+    for column_population, row_population in itertools.combinations(
+        range(len(sample_sizes)), 2
+    ):
+        obs_filepath = os.path.join(
+            output_dir,
+            f"{input_prefix}_joint{sfs_type}pop{row_population}_{column_population}.obs",
+        )
+        write_joint_sfs(
+            obs_filepath,
+            get_marginal_sfs(sfs, [row_population, column_population]),
+            row_population,
+            column_population,
+        )
+        derived_obs_filepaths.append(obs_filepath)
+
+    # 1D marginal SFS, e.g. hom_sap_DAFpop0.obs
+    for population in range(len(sample_sizes)):
+        obs_filepath = os.path.join(
+            output_dir, f"{input_prefix}_{sfs_type}pop{population}.obs"
+        )
+        write_marginal_sfs(
+            obs_filepath, get_marginal_sfs(sfs, [population]), population
+        )
+        derived_obs_filepaths.append(obs_filepath)
+
+    return derived_obs_filepaths
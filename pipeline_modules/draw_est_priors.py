@@ -0,0 +1,249 @@
+"""
+These functions draw concrete parameter values from the priors of a generated est file (in vectorized batches),
+write them to a columnar table, and optionally render fixed-value fastsimcoal .par files from the matching tpl
+"""
+
+import os
+import re
+
+import numpy as np
+
+PARAM_NAME_PATTERN = r"\b[A-Za-z_]\w*\$"
+EXPRESSION_TOKEN_PATTERN = (
+    r"[A-Za-z_]\w*\$|\d+\.?\d*(?:[eE][-+]?\d+)?|\.\d+(?:[eE][-+]?\d+)?|[-+*/()]"
+)
+
+
+def read_est(est_filepath):
+    # returns the simple params as (is_int, name, dist, min, max) and the complex params as (is_int, name, expression)
+    simple_params = []
+    complex_params = []
+    section = None
+    with open(est_filepath, "r") as est_file:
+        for line in est_file:
+            line = line.strip()
+            if not line or line.startswith("//"):
+                continue
+            if line.startswith("["):
+                section = line
+                continue
+
+            if section == "[PARAMETERS]":
+                is_int, name, dist, dist_min, dist_max = line.split()[:5]
+                simple_params.append(
+                    (is_int == "1", name, dist, float(dist_min), float(dist_max))
+                )
+            elif section == "[COMPLEX PARAMETERS]":
+                # e.g. "1 T_DIV12$ = T_1_2$ + T_ADMIX12$ output"
+                is_int, name, _, expression = line.split(maxsplit=3)
+                expression = expression.rsplit(maxsplit=1)[0]  # drop output/hide
+                complex_params.append((is_int == "1", name, expression))
+    return simple_params, complex_params
+
+
+def draw_simple_params(simple_params, num_draws, rng):
+    values = {}
+    for is_int, name, dist, dist_min, dist_max in simple_params:
+        if dist == "unif":
+            draws = rng.uniform(dist_min, dist_max, num_draws)
+        elif dist == "logunif":
+            draws = np.exp(rng.uniform(np.log(dist_min), np.log(dist_max), num_draws))
+        else:
+            raise ValueError(f"Unsupported prior distribution '{dist}' for {name}")
+        values[name] = np.round(draws) if is_int else draws
+    return values
+
+
+def evaluate_expression(expression, values):
+    # define nested functions
+    def parse_sum():
+        nonlocal position
+        result = parse_product()
+        while position < len(tokens) and tokens[position] in "+-":
+            operator = tokens[position]
+            position += 1
+            operand = parse_product()
+            result = result + operand if operator == "+" else result - operand
+        return result
+
+    def parse_product():
+        nonlocal position
+        result = parse_operand()
+        while position < len(tokens) and tokens[position] in "*/":
+            operator = tokens[position]
+            position += 1
+            operand = parse_operand()
+            result = result * operand if operator == "*" else result / operand
+        return result
+
+    def parse_operand():
+        nonlocal position
+        token = tokens[position]
+        position += 1
+        if token == "(":
+            result = parse_sum()
+            position += 1  # skip the closing bracket
+            return result
+        if token == "-":
+            return -parse_operand()
+        if token.endswith("$"):
+            return values[token]
+        return float(token)
+
+    # evaluates a fastsimcoal complex parameter expression on whole columns at once
+    tokens = re.findall(EXPRESSION_TOKEN_PATTERN, expression)
+    position = 0
+    return parse_sum()
+
+
+def evaluate_complex_params(complex_params, values):
+    # complex params are written in dependency order, so each can use the ones before it
+    for is_int, name, expression in complex_params:
+        result = evaluate_expression(expression, values)
+        values[name] = np.round(result) if is_int else result
+    return values
+
+
+def draw_parameter_batches(est_filepath, num_draws, batch_size=100000, seed=None):
+    simple_params, complex_params = read_est(est_filepath)
+    rng = np.random.default_rng(seed)
+
+    names = [param[1] for param in simple_params] + [
+        param[1] for param in complex_params
+    ]
+    int_names = {param[1] for param in simple_params + complex_params if param[0]}
+
+    for batch_start in range(0, num_draws, batch_size):
+        current_batch_size = min(batch_size, num_draws - batch_start)
+        values = draw_simple_params(simple_params, current_batch_size, rng)
+        values = evaluate_complex_params(complex_params, values)
+        yield names, int_names, values
+
+
+def write_parameter_table(table_filepath, num_draws, batches):
+    # define nested functions
+    def column_name(name):
+        return name.rstrip("$")
+
+    # the table is columnar: one named column per parameter, one row per draw
+    table = None
+    csv_file = None
+    row = 0
+    try:
+        for names, int_names, values in batches:
+            current_batch_size = len(values[names[0]])
+            if table_filepath.endswith(".npy"):
+                if table is None:
+                    dtype = [
+                        (column_name(name), "i8" if name in int_names else "f8")
+                        for name in names
+                    ]
+                    table = np.lib.format.open_memmap(
+                        table_filepath, mode="w+", dtype=dtype, shape=(num_draws,)
+                    )
+                for name in names:
+                    table[column_name(name)][row : row + current_batch_size] = values[
+                        name
+                    ]
+            else:
+                if csv_file is None:
+                    csv_file = open(table_filepath, "w")
+                    csv_file.write(",".join(column_name(name) for name in names) + "\n")
+                columns = format_columns(names, int_names, values)
+                csv_file.write("".join(",".join(draw) + "\n" for draw in zip(*columns)))
+            row += current_batch_size
+    finally:
+        if table is not None:
+            table.flush()
+        if csv_file is not None:
+            csv_file.close()
+
+
+def format_columns(names, int_names, values):
+    # convert each parameter column to strings once, rather than formatting value by value
+    columns = []
+    for name in names:
+        if name in int_names:
+            columns.append(values[name].astype(np.int64).astype(str))
+        else:
+            columns.append(np.char.mod("%.10g", values[name]))
+    return columns
+
+
+def get_par_template(tpl_filepath):
+    with open(tpl_filepath, "r") as tpl_file:
+        tpl_text = tpl_file.read()
+
+    # split the tpl once into fixed text and parameter slots
+    template_pieces = re.split(f"({PARAM_NAME_PATTERN})", tpl_text)
+    slots = [
+        (index, piece) for index, piece in enumerate(template_pieces) if index % 2 == 1
+    ]
+    return template_pieces, slots
+
+
+def get_par_columns(slots, names, int_names, values):
+    missing_params = {name for _, name in slots} - set(names)
+    if missing_params:
+        raise ValueError(
+            f"tpl parameters not defined in est: {', '.join(sorted(missing_params))}"
+        )
+    return dict(zip(names, format_columns(names, int_names, values)))
+
+
+def render_par(template_pieces, slots, columns, draw):
+    pieces = template_pieces.copy()
+    for index, name in slots:
+        pieces[index] = columns[name][draw]
+    return "".join(pieces)
+
+
+def write_par_files(tpl_filepath, par_dir, par_prefix, batches):
+    template_pieces, slots = get_par_template(tpl_filepath)
+
+    os.makedirs(par_dir, exist_ok=True)
+    par_number = 1
+    for names, int_names, values in batches:
+        columns = get_par_columns(slots, names, int_names, values)
+        for draw in range(len(values[names[0]])):
+            par_filepath = os.path.join(par_dir, f"{par_prefix}_{par_number}.par")
+            with open(par_filepath, "w") as par_file:
+                par_file.write(render_par(template_pieces, slots, columns, draw))
+            par_number += 1
+
+
+def generate_prior_draws(
+    tpl_filepath,
+    est_filepath,
+    num_draws,
+    batch_size=100000,
+    table_format="npy",
+    write_par=False,
+    seed=None,
+    model_index=None,
+):
+    # draws are written next to the est, e.g. hom_sap_prior_draws.npy and par_files/hom_sap_1.par
+    prefix = os.path.splitext(est_filepath)[0]
+    if table_format not in ["npy", "csv"]:
+        raise ValueError(f"Unsupported prior draw table format: {table_format}")
+
+    # fix the seed so the par files can replay the exact draws stored in the table
+    if seed is None:
+        seed = np.random.SeedSequence().entropy
+    elif model_index is not None:
+        # a fixed seed still gives every model its own stream, so shared parameters are not drawn identically
+        seed = np.random.SeedSequence([seed, model_index]).generate_state(4)
+
+    write_parameter_table(
+        f"{prefix}_prior_draws.{table_format}",
+        num_draws,
+        draw_parameter_batches(est_filepath, num_draws, batch_size, seed),
+    )
+
+    if write_par:
+        write_par_files(
+            tpl_filepath,
+            os.path.join(os.path.dirname(est_filepath), "par_files"),
+            os.path.basename(prefix),
+            draw_parameter_batches(est_filepath, num_draws, batch_size, seed),
+        )
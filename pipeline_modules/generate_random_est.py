@@ -1,8 +1,8 @@
 import re
 
 
-def write_est(simple_params, complex_params, est_filename):
-    lines = (
+def get_est_lines(simple_params, complex_params):
+    return (
         [
             "// Priors and rules file",
             "// *********************",
@@ -22,16 +22,27 @@ def write_est(simple_params, complex_params, est_filename):
         + [param for param in complex_params]
     )
 
+
+def write_est(est_lines, est_filename):
     # write to file
     with open(est_filename, "w") as file:
-        for line in lines:
-            file.write(line + "\n")
+        file.write("\n".join(est_lines) + "\n")
 
 
 def get_params_from_tpl(tpl, search_params):
     return [line for line in tpl if search_params in line]
 
 
+def split_source_sink(tpl, source_sink):
+    # population labels are zero-padded to the width of the largest deme index, the ghost is always "G"
+    number_of_populations = int(
+        tpl[tpl.index("//Number of population samples (demes)") + 1]
+    )
+    label_width = len(str(number_of_populations - 1))
+    source, sink = re.findall(r"G|\d{%d}" % label_width, source_sink)[:2]
+    return source, sink
+
+
 def get_mutation_rate_params(mutation_rate_dist):
     return [
         "0 MUTRATE$ {} {} {} output".format(
@@ -61,22 +72,24 @@ def get_effective_size_params(tpl, effective_pop_size_dist):
 def get_migration_params(tpl, migration_dist):
     # define nested functions
     def find_unique_params(list_to_search, pattern_to_find):
-        unique_params = set()
-        for element in list_to_search:
-            unique_params.update(re.findall(pattern_to_find, element))
+        # search all lines in one pass, keeping the order of first appearance (so the est is reproducible)
+        unique_params = dict.fromkeys(
+            re.findall(pattern_to_find, "\n".join(list_to_search))
+        )
         return list(unique_params)
 
     # get the migration parameters from tpl
     mig_params_from_tpl = get_params_from_tpl(tpl, "MIG")
-    # Pattern matches MIGxy$ or MIGxy_#$ (where # is a matrix index)
-    migration_pattern = r"\bMIG\w\w(?:_\d+)?\$*"
+    # Pattern matches MIGxy$ or MIGxy_#$ (where # is a matrix index, and x, y are population labels)
+    migration_pattern = r"\bMIG\w+\$"
 
     unique_migration_params = find_unique_params(mig_params_from_tpl, migration_pattern)
+    # the prior is the same for every migration param, so only format it once
+    migration_prior = "{} {} {}".format(
+        migration_dist["type"], migration_dist["min"], migration_dist["max"]
+    )
     migration_params = [
-        "0 {} {} {} {} output".format(
-            param, migration_dist["type"], migration_dist["min"], migration_dist["max"]
-        )
-        for param in unique_migration_params
+        f"0 {param} {migration_prior} output" for param in unique_migration_params
     ]
     return migration_params
 
@@ -201,11 +214,12 @@ def get_div_resize_params(tpl):
         # handle rest of the names
         for param in resize_params:
             source_sink = param[len("RELANC") : param.find("$")]
+            source, sink = split_source_sink(tpl, source_sink)
 
             complex_resize_params.append(
-                f"0 {param} = N_ANC{source_sink[0]}{source_sink[1]}$/N_POP{source_sink[1]}$ output"
+                f"0 {param} = N_ANC{source}{sink}$/N_POP{sink}$ output"
             )
-            simple_params_to_add.append(f"N_ANC{source_sink[0]}{source_sink[1]}$")
+            simple_params_to_add.append(f"N_ANC{source}{sink}$")
 
     return complex_resize_params, simple_params_to_add
 
@@ -269,21 +283,23 @@ def get_complex_params(tpl, time_dist, max_time_between_events):
     return complex_params, simple_params_to_add
 
 
-def generate_random_params(
-    tpl_filepath,
-    est_filename,
-    mutation_rate_dist,
-    effective_pop_size_dist,
-    migration_dist,
-    time_dist,
-    max_time_between_events=1000,
-):
+def read_tpl(tpl_filepath):
     # convert tpl file to list
     tpl = []
     with open(tpl_filepath, "r") as tpl_file:
         for line in tpl_file:
             tpl.append(line.strip())
+    return tpl
+
 
+def get_random_est_lines(
+    tpl,
+    mutation_rate_dist,
+    effective_pop_size_dist,
+    migration_dist,
+    time_dist,
+    max_time_between_events=1000,
+):
     # get simple params
     simple_params = get_simple_params(
         tpl=tpl,
@@ -309,5 +325,11 @@ def generate_random_params(
                 )
             )
 
-    # write to est
-    write_est(simple_params, complex_params, est_filename)
+    return get_est_lines(simple_params, complex_params)
+
+
+def generate_random_params(tpl_filepath, est_filename, **model_params):
+    # build the est from the tpl, and write it
+    write_est(
+        get_random_est_lines(read_tpl(tpl_filepath), **model_params), est_filename
+    )
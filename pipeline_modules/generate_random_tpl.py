@@ -2,12 +2,13 @@
 These functions take in some user provided parameters and randomly determine an evolutionary history to output to a .tpl file
 """
 
+import functools
+import itertools
+import math
 import random
-import re
 
 
-def write_tpl(
-    filename,
+def get_tpl_lines(
     number_of_populations,
     population_effective_sizes,
     sample_sizes,
@@ -43,10 +44,26 @@ def write_tpl(
         f"FREQ 1 0 MUTRATE$ OUTEXP",
         "",
     ]
+    return lines
 
+
+def write_tpl(filename, tpl_lines):
     # write to file
     with open(filename, "w") as tpl_file:
-        tpl_file.writelines("\n".join(lines))
+        tpl_file.write("\n".join(tpl_lines))
+
+
+def get_population_label_width(num_pops):
+    # population labels are zero-padded to the same width, so that concatenated labels stay
+    # unambiguous for any number of demes (e.g. T_DIV0312$ with 11+ demes, T_DIV12$ with up to 10)
+    return len(str(num_pops - 1))
+
+
+def get_population_label(population, num_pops):
+    # the ghost keeps its "G" label, which can never be confused with digits
+    if str(population) == "G":
+        return "G"
+    return str(population).zfill(get_population_label_width(num_pops))
 
 
 def get_population_list(num_pops, ghost_present):
@@ -55,7 +72,7 @@ def get_population_list(num_pops, ghost_present):
     population_range = num_pops - 1 if ghost_present else num_pops
 
     for i in range(0, population_range):
-        populations.append(str(i))
+        populations.append(get_population_label(i, num_pops))
 
     if ghost_present:
         populations.append("G")
@@ -68,49 +85,168 @@ def get_population_effective_sizes(number_of_populations, ghost_present):
     ]
 
 
-def get_admix_sources_and_sinks(ghost_present, number_of_populations):
+@functools.lru_cache(maxsize=None)
+def get_admix_attempt_weights(number_of_populations):
+    """
+    Admixture pairs used to be drawn from a random subset of sources and one of sinks (sizes uniform in
+    1..number_of_populations, capped by the populations available, the ghost available to one side only).
+    While the two came out identical, fresh subsets were appended to both, and a source and a sink were then
+    picked until they differed. Only whether the ghost is picked depends on the subsets, so this returns the
+    final (non-identical) attempts as (ghost side size, other side size, ghost drawn) with their cumulative
+    weights, and the probability and sizes (with cumulative weights) of the identical attempts appended before it.
+    """
+    number_of_real_pops = number_of_populations - 1
+    size_probability = 1 / number_of_populations
+
+    final_attempts, final_weights = [], []
+    identical_sizes, identical_weights = [], []
+    for ghost_side_size in range(1, number_of_populations + 1):
+        for other_side_size in range(1, number_of_real_pops + 1):
+            # the other side has no ghost, so all sizes from number_of_real_pops up are capped to it
+            probability = size_probability * (
+                size_probability
+                if other_side_size < number_of_real_pops
+                else 2 * size_probability
+            )
+            ghost_drawn_probability = ghost_side_size / number_of_populations
+            identical_probability = 0.0
+            if ghost_side_size == other_side_size:
+                # both sides drew the same real populations in the same order
+                identical_probability = 1 / math.perm(
+                    number_of_real_pops, other_side_size
+                )
+                identical_sizes.append(other_side_size)
+                identical_weights.append(
+                    probability * (1 - ghost_drawn_probability) * identical_probability
+                )
+            final_attempts.append((ghost_side_size, other_side_size, True))
+            final_weights.append(probability * ghost_drawn_probability)
+            final_attempts.append((ghost_side_size, other_side_size, False))
+            final_weights.append(
+                probability
+                * (1 - ghost_drawn_probability)
+                * (1 - identical_probability)
+            )
+
+    return (
+        final_attempts,
+        list(itertools.accumulate(final_weights)),
+        sum(identical_weights),
+        identical_sizes,
+        list(itertools.accumulate(identical_weights)),
+    )
+
+
+def get_ghost_picked(
+    number_of_real_pops, ghost_side_size, other_side_size, identical_sizes, rng=random
+):
+    # a source and a sink are picked uniformly from the pairs of different populations. As all real
+    # populations are exchangeable, the other side's final subset can be taken as the first other_side_size
+    if not identical_sizes:
+        # the overlap of the two sides is hypergeometric, drawn one ghost side population at a time
+        overlap = 0
+        for drawn in range(ghost_side_size - 1):
+            if rng.random() * (number_of_real_pops - drawn) < other_side_size - overlap:
+                overlap += 1
+        return (
+            rng.random() * (ghost_side_size * other_side_size - overlap)
+            < other_side_size
+        )
+
+    # the appended identical attempts add the same populations to both sides
+    ghost_side_counts = [0] * number_of_real_pops
+    other_side_counts = [
+        int(pop < other_side_size) for pop in range(number_of_real_pops)
+    ]
+    ghost_side_total = ghost_side_size
+    other_side_total = other_side_size
+    for size in identical_sizes:
+        for pop in rng.sample(range(number_of_real_pops), size):
+            ghost_side_counts[pop] += 1
+            other_side_counts[pop] += 1
+        ghost_side_total += size
+        other_side_total += size
+    for pop in rng.sample(range(number_of_real_pops), ghost_side_size - 1):
+        ghost_side_counts[pop] += 1
+
+    same_pop_pairs = sum(
+        ghost_side_count * other_side_count
+        for ghost_side_count, other_side_count in zip(
+            ghost_side_counts, other_side_counts
+        )
+    )
+    return (
+        rng.random() * (ghost_side_total * other_side_total - same_pop_pairs)
+        < other_side_total
+    )
+
+
+def draw_ghost_picked(number_of_populations):
+    (
+        final_attempts,
+        final_cum_weights,
+        identical_probability,
+        identical_sizes,
+        identical_cum_weights,
+    ) = get_admix_attempt_weights(number_of_populations)
+    ghost_side_size, other_side_size, ghost_drawn = random.choices(
+        final_attempts, cum_weights=final_cum_weights
+    )[0]
+    if not ghost_drawn:
+        return False
+
+    # the number of identical attempts before the final one is geometric
+    number_of_identical = int(
+        math.log(1 - random.random()) / math.log(identical_probability)
+    )
+    return get_ghost_picked(
+        number_of_populations - 1,
+        ghost_side_size,
+        other_side_size,
+        random.choices(
+            identical_sizes, cum_weights=identical_cum_weights, k=number_of_identical
+        ),
+    )
+
+
+def get_admix_source_and_sink(ghost_present, number_of_populations):
     # define nested functions
-    def add_source_or_sink(possible_sources_or_sinks):
-        sources_or_sinks = []
-        # iterate through all populations
-        for _ in range(random.randint(1, number_of_populations)):
-            if possible_sources_or_sinks == []:
-                break  # no more possibilities
-            new_source_or_sink = random.choice(
-                possible_sources_or_sinks
-            )  # pick a source/sink from possibilites
-            sources_or_sinks.append(str(new_source_or_sink))  # add to respective list
-            possible_sources_or_sinks.remove(
-                new_source_or_sink
-            )  # remove from possibilites
-        return sources_or_sinks
-
-    # initialize empty lists
-    sources, sinks = [], []
-
-    # randomly assign populations to sources or sinks (not all populations need be included)
-    while sources == sinks:  # keep iterating until sources and sinks are not identical
-        # add all populations as a possibility
-        possible_sources = list(range(number_of_populations))
-        possible_sinks = list(range(number_of_populations))
-
-        if ghost_present:
-            possible_sources.pop(
-                -1
-            )  # delete the last possible pop (so that we can assign it as "G" later)
-            possible_sinks.pop(-1)
-
-            # determine if ghost is source or sink
-            if random.choice([True, False]):
-                possible_sources.append("G")
-            else:
-                possible_sinks.append("G")
-
-        # randomly choose sources & sinks
-        sources.extend(add_source_or_sink(possible_sources))
-        sinks.extend(add_source_or_sink(possible_sinks))
-
-    return sources, sinks
+    def get_distinct_pair(number_of_candidates):
+        # uniform over ordered pairs of distinct populations, without redrawing
+        source = random.randrange(number_of_candidates)
+        sink = random.randrange(number_of_candidates - 1)
+        if sink >= source:
+            sink += 1
+        return str(source), str(sink)
+
+    number_of_real_pops = (
+        number_of_populations - 1 if ghost_present else number_of_populations
+    )
+
+    if not ghost_present:
+        if number_of_real_pops < 2:
+            raise ValueError(
+                "An admixture event needs two different populations (or a ghost)"
+            )
+        # by symmetry, the drawn subsets only decide whether the ghost is picked
+        return get_distinct_pair(number_of_real_pops)
+
+    # determine if ghost is source or sink
+    ghost_is_source = random.choice([True, False])
+
+    if number_of_real_pops < 2 or draw_ghost_picked(number_of_populations):
+        # the ghost is picked, the other side is any of the real populations
+        real_pop = str(random.randrange(number_of_real_pops))
+        return ("G", real_pop) if ghost_is_source else (real_pop, "G")
+
+    return get_distinct_pair(number_of_real_pops)
+
+
+def pop_random_element(elements):
+    # swap a random element to the end and pop it, instead of an O(n) list.remove
+    index = random.randrange(len(elements))
+    elements[index], elements[-1] = elements[-1], elements[index]
+    return elements.pop()
 
 
 def get_divergence_events(ghost_present, number_of_populations, pops_should_migrate):
@@ -142,7 +278,8 @@ def get_divergence_events(ghost_present, number_of_populations, pops_should_migr
     # assign pops as sinks
     sinks = random.sample(nodes, number_of_sinks)
     # assign all other pops as sources (can be 0)
-    sources = [node for node in nodes if node not in sinks]
+    sink_set = set(sinks)
+    sources = [node for node in nodes if node not in sink_set]
 
     # finish randomly assigning ghost as a source or sink if ghost exists
     if ghost_present:
@@ -154,24 +291,30 @@ def get_divergence_events(ghost_present, number_of_populations, pops_should_migr
     # the first divergence event should be in mig mat 1
     current_migration_matrix = 1 if pops_should_migrate else 0
 
+    # population labels
+    population_list = get_population_list(number_of_populations, ghost_present)
+
     # iterate as long as there are sources, or at least 2 sinks (the sinks will act as sources as soon as the sources are gone)
     while sources or len(sinks) > 1:
         # define empty event
         current_event = []
-        # randomly select a source
-        cur_source = random.choice(sources) if sources else random.choice(sinks)
-        # remove the selected source from the sources list
-        sources.remove(cur_source) if sources else sinks.remove(cur_source)
+        # randomly select a source, and remove it from the sources list
+        cur_source = pop_random_element(sources if sources else sinks)
         # randomly select a sink
         cur_sink = random.choice(sinks)
+        source_deme = get_deme(cur_source)
+        sink_deme = get_deme(cur_sink)
+        source_sink = (
+            f"{population_list[int(source_deme)]}{population_list[int(sink_deme)]}"
+        )
         # randomly choose whether to resize the new deme or not (a deme size of "0" would result in extinction)
-        new_deme_size = random.choice([f"RELANC{cur_source}{cur_sink}$", "1"])
+        new_deme_size = random.choice([f"RELANC{source_sink}$", "1"])
         # add params to current event
         current_event.extend(
             [
-                f"T_DIV{cur_source}{cur_sink}$",
-                get_deme(cur_source),
-                get_deme(cur_sink),
+                f"T_DIV{source_sink}$",
+                source_deme,
+                sink_deme,
                 "1",  # migrants
                 new_deme_size,
                 "0",  # growth rate
@@ -187,29 +330,27 @@ def get_divergence_events(ghost_present, number_of_populations, pops_should_migr
     return divergence_events
 
 
-def get_admixture_events(ghost_present, num_pops):
-    # get potential sources and sinks for the admixture event
-    sources, sinks = get_admix_sources_and_sinks(ghost_present, num_pops)
+def get_event_suffix(event_number):
+    # the first event of a type keeps the plain name, later ones are numbered (e.g. T_ADMIX12_2$)
+    return "" if event_number == 1 else f"_{event_number}"
 
-    # randomly select admixture/migration percentage
-    migrants = random.uniform(0, 1)
 
+def get_admixture_events(ghost_present, num_pops, event_number=1):
     # select two unique populations
-    unique_source_and_sink = False
-    while not unique_source_and_sink:
-        source = random.choice(sources)
-        sink = random.choice(sinks)
+    source, sink = get_admix_source_and_sink(ghost_present, num_pops)
 
-        if source != sink:
-            unique_source_and_sink = True
+    # randomly select admixture/migration percentage
+    migrants = random.uniform(0, 1)
+
+    source_sink = f"{get_population_label(source, num_pops)}{get_population_label(sink, num_pops)}"
 
     # initialize empty admixture event list
     admixture_events = []
     # create current event
     current_event = [
-        f"T_ADMIX{source}{sink}$",
-        str(num_pops) if source == "G" else source,
-        str(num_pops) if sink == "G" else sink,
+        f"T_ADMIX{source_sink}{get_event_suffix(event_number)}$",
+        str(num_pops - 1) if source == "G" else source,
+        str(num_pops - 1) if sink == "G" else sink,
         str(migrants),
         "1",  # new deme size, "1" implies that the size of the sink deme remains unchanged
         "0",  # growth rate
@@ -220,23 +361,25 @@ def get_admixture_events(ghost_present, num_pops):
     return admixture_events
 
 
-def get_bottleneck_events(num_pops, ghost_present):
+def get_bottleneck_events(num_pops, ghost_present, event_number=1):
     # initialize empty list for bottleneck events
     bottleneck_events = []
 
     # find the pop to bottleneck
-    source = sink = str(random.choice(list(range(num_pops))))
+    source = sink = str(random.randrange(num_pops))
     if ghost_present:
         if source == str(num_pops - 1):
             source = sink = "G"
 
+    source_sink = f"{get_population_label(source, num_pops)}{get_population_label(sink, num_pops)}"
+
     # define bottleneck start
     current_event = [
-        f"T_BOT{source}{sink}$",
+        f"T_BOT{source_sink}{get_event_suffix(event_number)}$",
         str(num_pops - 1) if source == "G" else str(source),
         str(num_pops - 1) if sink == "G" else str(sink),
         "0",  # migrants
-        f"RESBOT{source}{sink}$",  # new deme size
+        f"RESBOT{source_sink}{get_event_suffix(event_number)}$",  # new deme size
         "0",  # growth rate
         "0",  # migration matrix
     ]
@@ -249,93 +392,94 @@ def get_bottleneck_events(num_pops, ghost_present):
 def order_historical_events(historical_events):
     # define nested functions
     def extract_source_sink(event):
-        match = re.search(r"T*([0-9G]{2})", event)
-        source, sink = match.group(1)
+        # the source and sink demes are the 2nd and 3rd columns of every event
+        _, source, sink = event.split(" ", 3)[:3]
         return source, sink
 
-    def place_events(current_ordered_events, events_to_add):
-        # make a copy
-        newly_ordered_events = current_ordered_events.copy()
-        # iterate through new events
-        for cur_event in events_to_add:
-            # extract the current source and sink
-            cur_source, cur_sink = extract_source_sink(cur_event)
+    def get_migration_matrix(event):
+        return event.rsplit(" ", 1)[1]
 
-            # initilalize list of possible places to insert admix event
-            possible_insertion_indeces = []
+    def set_migration_matrix(event, migration_matrix):
+        return event.rsplit(" ", 1)[0] + " " + migration_matrix
 
-            # loop through current ordered events
-            for event in current_ordered_events:
-                event_source, event_sink = extract_source_sink(event)
-
-                # add the index of the event to possible indeces
-                possible_insertion_indeces.append(current_ordered_events.index(event))
-
-                # check to see if either cur event sink or source is dead
-                if cur_source == event_source or cur_sink == event_source:
-                    break
-
-            insertion_index = random.choice(possible_insertion_indeces)
-            newly_ordered_events.insert(insertion_index, cur_event)
-            newly_ordered_events = set_migration_matrix(
-                newly_ordered_events, insertion_index
-            )
+    def get_end_event(event, event_type):
+        # the "end" event mirrors the start event, but restores the deme size
+        event_parts = event.split()
+        event_parts[0] = event_parts[0].replace(f"T_{event_type}", f"T_{event_type}END")
+        event_parts[4] = event_parts[4].replace(
+            f"RES{event_type}", f"RES{event_type}END"
+        )
+        return " ".join(event_parts)
 
-        return newly_ordered_events
-
-    def add_end_events(current_ordered_events, event_type):
-        # make a copy
-        robust_ordered_events = current_ordered_events.copy()
-        for event in current_ordered_events:
-            # select the pertinenet event type
-            if event.startswith(f"T_{event_type}"):
-                event_parts = event.split()
-                # create the "end" event
-                end_event = (
-                    event_parts[0].replace(f"T_{event_type}", f"T_{event_type}END")
-                    + " "
-                    + " ".join(event_parts[1:])
-                )
-                # replace the event start deme resize with the event end deme resize
-                end_resize = event_parts[4].replace(
-                    f"RES{event_type}", f"RES{event_type}END"
-                )
-                end_event = end_event.replace(event_parts[4], end_resize)
+    # divide events into event types
+    divergence_events = []
+    events_to_place = []
+    for event in historical_events:
+        if "T_DIV" in event:
+            # div events are already in order, and form the timeline the other events are placed on
+            divergence_events.append(event)
+        elif "T_ADMIX" in event or "T_BOT" in event:
+            events_to_place.append(event)
+        # TODO: add other events here
 
-                event_index = robust_ordered_events.index(event)
-                robust_ordered_events.insert(
-                    event_index + 1, end_event
-                )  # add to all events right after the starting event
-        return robust_ordered_events
+    # find when each lineage dies (going back in time, a lineage is gone once it has diverged from its sink)
+    last_divergence_index = max(len(divergence_events) - 1, 0)
+    lineage_end = {}
+    for divergence_index, event in enumerate(divergence_events):
+        source, _ = extract_source_sink(event)
+        lineage_end.setdefault(source, divergence_index)
+
+    # slot i holds the events placed right before divergence event i; an event can be placed
+    # anywhere up to (and including) the divergence that ends its source or sink
+    slots = [[] for _ in range(last_divergence_index + 1)]
+    for event in events_to_place:
+        source, sink = extract_source_sink(event)
+        latest_slot = min(
+            lineage_end.get(source, last_divergence_index),
+            lineage_end.get(sink, last_divergence_index),
+        )
+        slots[random.randint(0, latest_slot)].append(event)
 
+    # build the ordered timeline in a single pass
     ordered_historical_events = []
-    # divide events into event types
-    admix_events = []
-    bot_events = []
+    for slot_index, slot_events in enumerate(slots):
+        random.shuffle(slot_events)
+
+        # placed events take the migration matrix of either of the divergence events around them
+        possible_migration_matrices = [
+            (
+                get_migration_matrix(divergence_events[slot_index - 1])
+                if slot_index > 0
+                else "0"
+            )
+        ]
+        if divergence_events:
+            possible_migration_matrices.append(
+                get_migration_matrix(divergence_events[slot_index])
+            )
 
-    for event in historical_events:
-        if "T_DIV" in event:
-            # add div events to ordered bc they are already in order
+        for event in slot_events:
+            event = set_migration_matrix(
+                event, random.choice(possible_migration_matrices)
+            )
             ordered_historical_events.append(event)
-        elif "T_ADMIX" in event:
-            admix_events.append(event)
-        elif "T_BOT" in event:
-            bot_events.append(event)
-        # TODO: add other events here
+            if event.startswith("T_BOT"):
+                # make sure that the bottleneck ends right after it starts
+                ordered_historical_events.append(get_end_event(event, "BOT"))
 
-    # put events in random -- but chronologically correct -- order
-    # start with admixture events
-    ordered_historical_events = place_events(ordered_historical_events, admix_events)
-    # then, bottleneck events
-    if bot_events:
-        ordered_historical_events = place_events(ordered_historical_events, bot_events)
-        # here, make sure that the bottleneck endings are accurate
-        ordered_historical_events = add_end_events(ordered_historical_events, "BOT")
+        if divergence_events:
+            ordered_historical_events.append(divergence_events[slot_index])
 
     return ordered_historical_events
 
 
-def get_historical_events(ghost_present, number_of_populations, pops_should_migrate):
+def get_historical_events(
+    ghost_present,
+    number_of_populations,
+    pops_should_migrate,
+    max_admix_events=1,
+    max_bottlenecks=1,
+):
     """
     This function generates all historical events - divergence, admixture, and bottlenecks
     """
@@ -353,18 +497,30 @@ def get_historical_events(ghost_present, number_of_populations, pops_should_migr
         divergence_events
     )  # add divergence events to historical events
 
-    # randomize adding admixture (50% probability)
-    if random.choice([True, False]):
+    # randomize adding each admixture event (50% probability each)
+    number_of_admix_events = sum(
+        random.choice([True, False]) for _ in range(max_admix_events)
+    )
+    if not ghost_present and number_of_populations < 2:
+        number_of_admix_events = 0  # no two different populations to admix
+    for event_number in range(1, number_of_admix_events + 1):
         admixture_events = get_admixture_events(
-            ghost_present=ghost_present, num_pops=number_of_populations
+            ghost_present=ghost_present,
+            num_pops=number_of_populations,
+            event_number=event_number,
         )
         historical_events.extend(
             admixture_events
         )  # add admixture events to historical events
 
-    # randomize adding bottlenecks (50% probability)
-    if random.choice([True, False]):
-        bottleneck_events = get_bottleneck_events(number_of_populations, ghost_present)
+    # randomize adding each bottleneck (50% probability each)
+    number_of_bottlenecks = sum(
+        random.choice([True, False]) for _ in range(max_bottlenecks)
+    )
+    for event_number in range(1, number_of_bottlenecks + 1):
+        bottleneck_events = get_bottleneck_events(
+            number_of_populations, ghost_present, event_number=event_number
+        )
         historical_events.extend(bottleneck_events)
 
     # TODO: add exponential growths.
@@ -377,61 +533,34 @@ def get_historical_events(ghost_present, number_of_populations, pops_should_migr
     return historical_events, divergence_events
 
 
-def set_migration_matrix(events, event_index):
-    current_event = events[event_index]
-    possible_mig_mat_indeces = []
-
-    previous_event = events[event_index - 1] if event_index != 0 else None
-    next_event = events[event_index + 1] if event_index != len(events) - 1 else None
-
-    migration_matrix_extraction_pattern = r"(\d+)$"
-    prev_match = (
-        re.search(migration_matrix_extraction_pattern, previous_event)
-        if previous_event
-        else None
-    )
-    next_match = (
-        re.search(migration_matrix_extraction_pattern, next_event)
-        if next_event
-        else None
-    )
-
-    possible_mig_mat_indeces = [prev_match.group(1)] if prev_match else ["0"]
-    if next_match:
-        possible_mig_mat_indeces.append(next_match.group(1))
-
-    new_migration_matrix = random.choice(possible_mig_mat_indeces)
-    updated_current_event = re.sub(
-        migration_matrix_extraction_pattern, new_migration_matrix, current_event
-    )
-
-    events[event_index] = updated_current_event
-
-    return events
-
-
 def get_matrix_template(
-    num_pops, ghost_present, matrix_index=0, migration_varies_by_matrix=False
+    num_pops,
+    ghost_present,
+    matrix_index=0,
+    migration_varies_by_matrix=False,
+    coalesced_populations=(),
 ):
-    # this function filles out a completed migration matrix (i.e. migration between all pops)
+    # this function filles out a migration matrix (i.e. migration between all pops that have not coalesced yet)
     matrix_label = f"//Migration matrix {matrix_index}"
     matrix = [matrix_label]
 
-    for i in range(1, num_pops + 1):
-        row = []
-        for j in range(1, num_pops + 1):
-            if i == j:
-                matrix_i_j = "0.000"
-            else:
-                populations_list = get_population_list(num_pops, ghost_present)
-                from_pop = populations_list[i - 1]
-                to_pop = populations_list[j - 1]
-                # Add matrix index suffix if migration varies by matrix
-                if migration_varies_by_matrix:
-                    matrix_i_j = f"MIG{from_pop}{to_pop}_{matrix_index}$"
-                else:
-                    matrix_i_j = f"MIG{from_pop}{to_pop}$"
-            row.append(matrix_i_j)
+    # Add matrix index suffix if migration varies by matrix
+    suffix = f"_{matrix_index}" if migration_varies_by_matrix else ""
+    populations_list = get_population_list(num_pops, ghost_present)
+    zero_row = " ".join(["0.000"] * num_pops)
+
+    for from_pop in populations_list:
+        if from_pop in coalesced_populations:
+            matrix.append(zero_row)
+            continue
+        row = [
+            (
+                "0.000"
+                if to_pop == from_pop or to_pop in coalesced_populations
+                else f"MIG{from_pop}{to_pop}{suffix}$"
+            )
+            for to_pop in populations_list
+        ]
         matrix.append(" ".join(row))
     return matrix
 
@@ -439,20 +568,6 @@ def get_matrix_template(
 def get_migration_matrices(
     num_pops, ghost_present, divergence_events, migration_varies_by_matrix=False
 ):
-    # define in nested functions
-    def extract_coalescing_population(event):
-        # find the coalescing pop (the source)
-        match = re.search(r"^T_DIV([0-9a-zA-Z])+[0-9a-zA-Z]", event)
-        if match:
-            coalescing_population = match.group(1)
-            # if ghost, replace number with "G"
-            if ghost_present:
-                if coalescing_population == str(num_pops - 1):
-                    return "G"
-            return coalescing_population
-        else:
-            return None
-
     # start by defining empty list
     matrices = []
     # the first matrix is a complete migration matrix
@@ -464,88 +579,38 @@ def get_migration_matrices(
     )
     matrices.append(first_matrix)
 
-    # start with the fully filled out migration matrix
-    current_matrix = get_matrix_template(
-        num_pops,
-        ghost_present,
-        matrix_index=0,
-        migration_varies_by_matrix=migration_varies_by_matrix,
-    )
-
-    # Track all populations that have coalesced (for varying migration option)
-    coalesced_populations = []
+    # Track all populations that have coalesced, migration to and from them stops
+    populations_list = get_population_list(num_pops, ghost_present)
+    coalesced_populations = set()
 
     # loop through all divergence events going back in time
-    for i in range(len(divergence_events)):
-        current_event = divergence_events[i]
+    for current_event in divergence_events:
+        event_parts = current_event.split()
         # find the migration matrix of the current event
-        current_event_matrix_index = int(re.search(r"\d+$", current_event).group())
+        current_event_matrix_index = int(event_parts[-1])
+
+        # get the coalescing population (the source deme)
+        coalesced_populations.add(populations_list[int(event_parts[1])])
 
-        # If migration varies by matrix, create a new template for this matrix
-        # Otherwise, use the current matrix and remove coalesced populations
-        if migration_varies_by_matrix:
-            current_matrix = get_matrix_template(
+        # add to the matrices list
+        matrices.append(
+            get_matrix_template(
                 num_pops,
                 ghost_present,
                 matrix_index=current_event_matrix_index,
-                migration_varies_by_matrix=True,
+                migration_varies_by_matrix=migration_varies_by_matrix,
+                coalesced_populations=coalesced_populations,
             )
-
-            # Zero out migration for all previously coalesced populations
-            matrix_without_label = current_matrix[1:]
-            for coalesced_pop in coalesced_populations:
-                pattern = r"MIG{}[0-9a-zA-Z]*_\d+\$|MIG[0-9a-zA-Z]*{}_\d+\$".format(
-                    coalesced_pop, coalesced_pop
-                )
-                matrix_without_label = [
-                    re.sub(pattern, "0.000", line) for line in matrix_without_label
-                ]
-            current_matrix = [current_matrix[0]] + matrix_without_label
-
-        # get the coalescing population (the source)
-        coalescing_population = extract_coalescing_population(current_event)
-
-        # Track this population as coalesced for future matrices (varying migration only)
-        if migration_varies_by_matrix and coalescing_population:
-            coalesced_populations.append(coalescing_population)
-
-        # Pattern to match migration parameters with the coalescing population
-        # Need to handle both with and without matrix index suffix
-        if migration_varies_by_matrix:
-            coalescing_population_in_matrix_pattern = (
-                r"MIG{}[0-9a-zA-Z]*_\d+\$|MIG[0-9a-zA-Z]*{}_\d+\$".format(
-                    coalescing_population, coalescing_population
-                )
-            )
-        else:
-            coalescing_population_in_matrix_pattern = (
-                r"MIG{}[0-9a-zA-Z$]*|MIG[0-9a-zA-Z]*{}\$".format(
-                    coalescing_population, coalescing_population
-                )
-            )
-
-        # make a temp matrix without the label
-        matrix_without_label = current_matrix[1:]
-
-        # replace any MIG param that has the coalescing population in i
-        current_matrix = [
-            re.sub(coalescing_population_in_matrix_pattern, "0.000", line)
-            for line in matrix_without_label
-        ]
-        # get updated matrix label
-        matrix_label = f"//Migration matrix {current_event_matrix_index}"
-
-        # add label to new matrix
-        current_matrix.insert(0, matrix_label)
-
-        # add to the matrices list
-        matrices.append(current_matrix)
+        )
 
     return matrices
 
 
-def generate_random_params(
-    tpl_filename, user_given_number_of_populations, user_given_sample_sizes
+def get_random_tpl_lines(
+    user_given_number_of_populations,
+    user_given_sample_sizes,
+    max_admix_events=1,
+    max_bottlenecks=1,
 ):
     # determine if there is a ghost population
     add_ghost = random.choice([True, False])
@@ -578,6 +643,8 @@ def generate_random_params(
         ghost_present=add_ghost,
         number_of_populations=number_of_populations,
         pops_should_migrate=pops_should_migrate,
+        max_admix_events=max_admix_events,
+        max_bottlenecks=max_bottlenecks,
     )
 
     # build migration matrices (if there is migration)
@@ -596,9 +663,8 @@ def generate_random_params(
         number_of_populations, add_ghost
     )
 
-    # write all generated parameters and variables to a tpl file
-    write_tpl(
-        filename=tpl_filename,
+    # put all generated parameters and variables into tpl lines
+    return get_tpl_lines(
         number_of_populations=number_of_populations,
         population_effective_sizes=population_effective_sizes,
         sample_sizes=sample_sizes,
@@ -606,3 +672,22 @@ def generate_random_params(
         migration_matrices=migration_matrices,
         historical_events=historical_events,
     )
+
+
+def generate_random_params(
+    tpl_filename,
+    user_given_number_of_populations,
+    user_given_sample_sizes,
+    max_admix_events=1,
+    max_bottlenecks=1,
+):
+    # write a random topology to a tpl file
+    write_tpl(
+        tpl_filename,
+        get_random_tpl_lines(
+            user_given_number_of_populations,
+            user_given_sample_sizes,
+            max_admix_events=max_admix_events,
+            max_bottlenecks=max_bottlenecks,
+        ),
+    )
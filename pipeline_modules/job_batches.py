@@ -0,0 +1,210 @@
+"""
+These functions predict the fastsimcoal cost of each generated model and pack the models into balanced job batches
+(e.g. one batch per SLURM array task) so that every batch has roughly the same wall time
+"""
+
+import glob
+import heapq
+import os
+
+import numpy as np
+
+from pipeline_modules import run_fastsimcoal
+from utilities import model_catalog  # type: ignore
+
+FEATURE_NAMES = ["num_params", "num_matrices", "num_events", "log_sfs_size"]
+
+# default log-cost coefficients (intercept first), used until measured runtimes are available
+DEFAULT_COST_COEFFICIENTS = [0.0, 0.1, 0.3, 0.15, 1.0]
+
+
+def get_sfs_size(obs_filepath, sfs_size_cache):
+    # the same .obs files are copied into every model, so only read each one once
+    cache_key = (os.path.basename(obs_filepath), os.path.getsize(obs_filepath))
+    if cache_key not in sfs_size_cache:
+        with open(obs_filepath, "r") as obs_file:
+            lines = obs_file.read().splitlines()
+        if "DSFS" in obs_filepath or "MSFS" in obs_filepath:
+            # multidimensional SFS: the sample sizes are on the second line
+            sample_sizes = [int(size) for size in lines[1].split()[1:]]
+            size = int(np.prod([sample_size + 1 for sample_size in sample_sizes]))
+        else:
+            # joint/marginal SFS: count the entries below the header lines, skipping the row labels
+            size = sum(
+                len(line.split()) - 1 if line.startswith("d") else len(line.split())
+                for line in lines[2:]
+            )
+        sfs_size_cache[cache_key] = size
+    return sfs_size_cache[cache_key]
+
+
+def get_model_features(model_dir, input_prefix, sfs_size_cache):
+    tpl_filepath = os.path.join(model_dir, f"{input_prefix}.tpl")
+    est_filepath = os.path.join(model_dir, f"{input_prefix}.est")
+
+    with open(tpl_filepath, "r") as tpl_file:
+        tpl_features = model_catalog.read_tpl_features(tpl_file.read().splitlines())
+    num_params = model_catalog.count_est_params(est_filepath)
+
+    sfs_size = sum(
+        get_sfs_size(obs_filepath, sfs_size_cache)
+        for obs_filepath in glob.glob(os.path.join(model_dir, "*.obs"))
+    )
+
+    return [
+        num_params,
+        tpl_features["num_matrices"],
+        len(tpl_features["events"]),
+        np.log(max(sfs_size, 1)),
+    ]
+
+
+def read_runtimes(runtimes_filepath):
+    # tab separated: model directory (or only its name, e.g. random_model_3), runtime in seconds
+    runtimes = []
+    with open(runtimes_filepath, "r") as runtimes_file:
+        for line in runtimes_file:
+            fields = line.split()
+            if len(fields) < 2 or line.startswith("#"):
+                continue
+            try:
+                runtimes.append((fields[0], float(fields[1])))
+            except ValueError:
+                continue  # header line
+    return runtimes
+
+
+def get_runtime_features(runtimes, model_dirs, features, input_prefix, sfs_size_cache):
+    # pair every measured runtime with the features of the model it was measured on, read from the listed
+    # directory; only a directory that does not exist (e.g. a bare model name) falls back to the current model
+    # of the same name
+    features_by_path = {
+        os.path.realpath(model_dir): model_features
+        for model_dir, model_features in zip(model_dirs, features)
+    }
+    features_by_name = {
+        os.path.basename(model_dir): model_features
+        for model_dir, model_features in zip(model_dirs, features)
+    }
+    measured = []
+    for model_path, runtime in runtimes:
+        if runtime <= 0:
+            continue
+        model_path = os.path.expanduser(model_path)
+        if os.path.isdir(model_path):
+            model_features = features_by_path.get(os.path.realpath(model_path))
+            if model_features is None:
+                model_features = get_model_features(
+                    model_path, input_prefix, sfs_size_cache
+                )
+        else:
+            model_features = features_by_name.get(
+                os.path.basename(os.path.normpath(model_path))
+            )
+            if model_features is None:
+                continue
+        measured.append((model_features, np.log(runtime)))
+    return measured
+
+
+def fit_cost_coefficients(measured):
+    # refine the default log-cost model with measured runtimes of past runs
+    coefficients = np.array(DEFAULT_COST_COEFFICIENTS)
+    if not measured:
+        return coefficients
+
+    design = np.array([[1.0] + model_features for model_features, _ in measured])
+    log_runtimes = np.array([log_runtime for _, log_runtime in measured])
+
+    if len(measured) > len(coefficients):
+        # enough runs to fit every coefficient
+        coefficients, *_ = np.linalg.lstsq(design, log_runtimes, rcond=None)
+    else:
+        # too few runs: keep the default shape and only rescale to seconds
+        coefficients[0] = np.mean(log_runtimes - design[:, 1:] @ coefficients[1:])
+    return coefficients
+
+
+def pack_into_batches(costs, num_batches):
+    # longest processing time first: give the next most expensive model to the currently lightest batch
+    batches = [[] for _ in range(num_batches)]
+    batch_loads = [(0.0, batch_index) for batch_index in range(num_batches)]
+    heapq.heapify(batch_loads)
+    for model_index in sorted(range(len(costs)), key=lambda i: costs[i], reverse=True):
+        load, batch_index = heapq.heappop(batch_loads)
+        batches[batch_index].append(model_index)
+        heapq.heappush(batch_loads, (load + costs[model_index], batch_index))
+    return [batch for batch in batches if batch]
+
+
+def write_job_batches(
+    output_dir,
+    input_prefix,
+    num_batches=None,
+    target_batch_cost=None,
+    runtimes_file=None,
+):
+    model_dirs = run_fastsimcoal.get_model_dirs(output_dir)
+    if not model_dirs:
+        print(
+            f"Warning: no random models found in {output_dir}, no job batches written"
+        )
+        return
+
+    # predict the cost of every model
+    sfs_size_cache = {}
+    features = [
+        get_model_features(model_dir, input_prefix, sfs_size_cache)
+        for model_dir in model_dirs
+    ]
+    model_names = [os.path.basename(model_dir) for model_dir in model_dirs]
+    runtimes = read_runtimes(os.path.expanduser(runtimes_file)) if runtimes_file else []
+    coefficients = fit_cost_coefficients(
+        get_runtime_features(
+            runtimes, model_dirs, features, input_prefix, sfs_size_cache
+        )
+    )
+    costs = list(
+        np.exp(
+            np.column_stack([np.ones(len(features)), np.array(features)]) @ coefficients
+        )
+    )
+
+    # determine the number of batches
+    if num_batches is None:
+        num_batches = (
+            max(1, int(np.ceil(sum(costs) / target_batch_cost)))
+            if target_batch_cost
+            else min(len(model_dirs), 100)
+        )
+    batches = pack_into_batches(costs, min(num_batches, len(model_dirs)))
+
+    # write per-model costs
+    with open(os.path.join(output_dir, "model_costs.tsv"), "w") as costs_file:
+        costs_file.write(
+            "\t".join(["model"] + FEATURE_NAMES + ["predicted_cost"]) + "\n"
+        )
+        for name, model_features, cost in zip(model_names, features, costs):
+            costs_file.write(
+                "\t".join(
+                    [name]
+                    + [f"{feature:g}" for feature in model_features]
+                    + [f"{cost:.6g}"]
+                )
+                + "\n"
+            )
+
+    # write the batches, and a SLURM array manifest (line i holds the models of array task i)
+    with open(os.path.join(output_dir, "job_batches.tsv"), "w") as batches_file, open(
+        os.path.join(output_dir, "slurm_array_manifest.txt"), "w"
+    ) as manifest_file:
+        batches_file.write("batch\tmodel\tpredicted_cost\tbatch_cost\n")
+        for batch_number, batch in enumerate(batches, start=1):
+            batch_cost = sum(costs[model_index] for model_index in batch)
+            for model_index in batch:
+                batches_file.write(
+                    f"{batch_number}\t{model_dirs[model_index]}\t{costs[model_index]:.6g}\t{batch_cost:.6g}\n"
+                )
+            manifest_file.write(
+                " ".join(model_dirs[model_index] for model_index in batch) + "\n"
+            )
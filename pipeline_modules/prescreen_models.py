@@ -0,0 +1,195 @@
+"""
+These functions cheaply pre-screen random topologies against the observed SFS: pairwise differentiation (Hudson's Fst)
+is computed once from the .obs files, and each topology's divergence order and admixture edges are scored for
+consistency with it, so that implausible topologies can be dropped (or ranked last) before they are written
+"""
+
+import math
+import os
+import re
+
+import numpy as np
+
+from pipeline_modules import derive_obs_files
+from utilities import model_catalog  # type: ignore
+
+
+def read_joint_sfs(obs_filepath):
+    # rows are the first population in the file name (popX of jointDAFpopX_Y), columns the second
+    with open(obs_filepath, "r") as obs_file:
+        lines = obs_file.read().splitlines()
+    return np.array(
+        [line.split()[1:] for line in lines[2:] if line.strip()], dtype=float
+    )
+
+
+def get_hudson_fst(joint_sfs):
+    # Hudson's Fst as a ratio of averages over all polymorphic SFS entries
+    sample_size_x, sample_size_y = joint_sfs.shape[0] - 1, joint_sfs.shape[1] - 1
+    frequency_x = np.arange(sample_size_x + 1)[:, None] / sample_size_x
+    frequency_y = np.arange(sample_size_y + 1)[None, :] / sample_size_y
+
+    numerator = (
+        (frequency_x - frequency_y) ** 2
+        - frequency_x * (1 - frequency_x) / max(sample_size_x - 1, 1)
+        - frequency_y * (1 - frequency_y) / max(sample_size_y - 1, 1)
+    )
+    denominator = frequency_x * (1 - frequency_y) + frequency_y * (1 - frequency_x)
+
+    # monomorphic entries carry no information
+    counts = joint_sfs.copy()
+    counts[0, 0] = 0
+    counts[-1, -1] = 0
+
+    total_denominator = np.sum(counts * denominator)
+    if total_denominator == 0:
+        return 0.0
+    return float(np.sum(counts * numerator) / total_denominator)
+
+
+def get_pairwise_differentiation(obs_files, num_pops):
+    differentiation = np.full((num_pops, num_pops), np.nan)
+    np.fill_diagonal(differentiation, 0.0)
+
+    # prefer the joint SFS files, e.g. hom_sap_jointDAFpop1_0.obs
+    multidimensional_obs_file = None
+    for obs_file in obs_files:
+        obs_filename = os.path.basename(obs_file)
+        match = re.search(r"joint[DM]AFpop(\d+)_(\d+)\.obs$", obs_filename)
+        if match:
+            pop_x, pop_y = int(match.group(1)), int(match.group(2))
+            if pop_x < num_pops and pop_y < num_pops:
+                fst = get_hudson_fst(read_joint_sfs(obs_file))
+                differentiation[pop_x, pop_y] = differentiation[pop_y, pop_x] = fst
+        elif "DSFS" in obs_filename or "MSFS" in obs_filename:
+            multidimensional_obs_file = obs_file
+
+    # fill in any missing pairs from the multidimensional SFS
+    if np.isnan(differentiation).any() and multidimensional_obs_file:
+        _, sfs = derive_obs_files.read_multidimensional_sfs(multidimensional_obs_file)
+        for pop_x in range(num_pops):
+            for pop_y in range(pop_x):
+                if np.isnan(differentiation[pop_x, pop_y]):
+                    fst = get_hudson_fst(
+                        derive_obs_files.get_marginal_sfs(sfs, [pop_x, pop_y])
+                    )
+                    differentiation[pop_x, pop_y] = differentiation[pop_y, pop_x] = fst
+
+    if np.isnan(differentiation).any():
+        raise ValueError(
+            "PRESCREEN needs a joint SFS for every pair of populations, or a multidimensional SFS"
+        )
+    return differentiation
+
+
+def score_model(tpl_lines, differentiation):
+    # define nested functions
+    def get_clade_distance(clade_a, clade_b):
+        # mean differentiation between the sampled populations of two lineages (None if one is only a ghost)
+        if not clade_a or not clade_b:
+            return None
+        return float(np.mean(differentiation[np.ix_(sorted(clade_a), sorted(clade_b))]))
+
+    features = model_catalog.read_tpl_features(tpl_lines)
+
+    # every lineage starts as a clade holding its own sampled population (the ghost has none)
+    clades = {}
+    for event in features["events"]:
+        for population in [event["source"], event["sink"]]:
+            clades.setdefault(
+                population, set() if population == "G" else {int(population)}
+            )
+
+    merge_distances = []
+    admixture_consistency = []
+    for event in features["events"]:
+        source, sink = event["source"], event["sink"]
+        if event["event_type"] == "DIV":
+            # going back in time, the source lineage merges into the sink lineage
+            distance = get_clade_distance(clades[source], clades[sink])
+            if distance is not None:
+                merge_distances.append(distance)
+            clades[sink] = clades[sink] | clades.pop(source)
+        elif event["event_type"] == "ADMIX":
+            # an admixture edge should join lineages that are more similar than average
+            distance = get_clade_distance(clades[source], clades[sink])
+            other_distances = [
+                get_clade_distance(clades[source], clade)
+                for population, clade in clades.items()
+                if population not in [source, sink]
+            ]
+            other_distances = [d for d in other_distances if d is not None]
+            if distance is not None and other_distances:
+                admixture_consistency.append(distance <= np.mean(other_distances))
+
+    # the least differentiated lineages should merge first: count concordant pairs of merges
+    divergence_score = None
+    num_merges = len(merge_distances)
+    if num_merges > 1:
+        concordant = sum(
+            merge_distances[i] <= merge_distances[j]
+            for i in range(num_merges)
+            for j in range(i + 1, num_merges)
+        )
+        divergence_score = concordant / (num_merges * (num_merges - 1) / 2)
+
+    admixture_score = (
+        sum(admixture_consistency) / len(admixture_consistency)
+        if admixture_consistency
+        else None
+    )
+
+    component_scores = [
+        score for score in [divergence_score, admixture_score] if score is not None
+    ]
+    score = np.mean(component_scores) if component_scores else 0.5
+    return float(score), divergence_score, admixture_score
+
+
+def prescreen_tpls(
+    tpl_candidates,
+    obs_files,
+    num_pops,
+    scores_filepath,
+    drop_fraction=0.25,
+    mode="drop",
+):
+    if mode not in ["drop", "rank"]:
+        raise ValueError(f"Unsupported PRESCREEN mode: {mode}")
+
+    # the observed differentiation is computed once for all candidates
+    differentiation = get_pairwise_differentiation(obs_files, num_pops)
+    scores = [score_model(tpl_lines, differentiation) for tpl_lines in tpl_candidates]
+
+    # rank from most to least plausible (stable, so ties keep their generation order)
+    ranking = sorted(
+        range(len(tpl_candidates)), key=lambda i: scores[i][0], reverse=True
+    )
+    num_kept = len(ranking)
+    if mode == "drop":
+        num_kept = max(1, math.ceil(len(ranking) * (1 - drop_fraction)))
+
+    def format_score(score):
+        return "NA" if score is None else f"{score:.4f}"
+
+    with open(scores_filepath, "w") as scores_file:
+        scores_file.write(
+            "candidate\tscore\tdivergence_score\tadmixture_score\trank\tmodel\n"
+        )
+        for rank, candidate in enumerate(ranking, start=1):
+            score, divergence_score, admixture_score = scores[candidate]
+            scores_file.write(
+                "\t".join(
+                    [
+                        str(candidate + 1),
+                        format_score(score),
+                        format_score(divergence_score),
+                        format_score(admixture_score),
+                        str(rank),
+                        f"random_model_{rank}" if rank <= num_kept else "dropped",
+                    ]
+                )
+                + "\n"
+            )
+
+    return [tpl_candidates[candidate] for candidate in ranking[:num_kept]]
@@ -0,0 +1,323 @@
+"""
+These functions run fastsimcoal replicates of the generated models on a shared pool of processes. The likelihood
+output of every replicate is tailed while it runs, and replicates that trail the best replicate of their model by
+more than a margin (after a number of warm-up loops) are stopped early, recording why
+"""
+
+import collections
+import glob
+import os
+import re
+import selectors
+import shlex
+import shutil
+import subprocess
+
+from pipeline_modules import warm_start_priors
+
+# e.g. "MaxEstLhood = -12345.678" in fastsimcoal's progress output
+DEFAULT_LIKELIHOOD_PATTERN = (
+    r"MaxEstLhood\s*[=:]?\s*(-?\d+\.?\d*(?:[eE][-+]?\d+)?|-?\.\d+(?:[eE][-+]?\d+)?)"
+)
+
+
+def get_model_dirs(output_dir):
+    return sorted(
+        glob.glob(os.path.join(output_dir, "random_model_*")),
+        key=lambda path: int(path.rsplit("_", 1)[1]),
+    )
+
+
+def resolve_executable(executable):
+    # replicates run in their own directories, so the executable is resolved from the current one up front
+    if os.sep in executable:
+        return os.path.abspath(executable)
+    return shutil.which(executable) or executable
+
+
+def setup_replicate_dir(model_dir, input_prefix, replicate_name):
+    # every replicate runs in its own directory, with the model's files linked rather than copied
+    replicate_dir = os.path.join(model_dir, replicate_name)
+    os.makedirs(replicate_dir, exist_ok=True)
+    model_filepaths = [
+        os.path.join(model_dir, f"{input_prefix}.{extension}")
+        for extension in ["tpl", "est", "pv"]
+    ] + glob.glob(os.path.join(model_dir, "*.obs"))
+    for filepath in model_filepaths:
+        link_filepath = os.path.join(replicate_dir, os.path.basename(filepath))
+        if os.path.exists(filepath) and not os.path.lexists(link_filepath):
+            os.symlink(os.path.relpath(filepath, replicate_dir), link_filepath)
+    return replicate_dir
+
+
+def get_fastsimcoal_command(replicate_dir, input_prefix, executable, arguments):
+    command = [
+        executable,
+        "-t",
+        f"{input_prefix}.tpl",
+        "-e",
+        f"{input_prefix}.est",
+        *shlex.split(arguments),
+    ]
+    # start from the warm-start initial values, if the model has them
+    if os.path.exists(os.path.join(replicate_dir, f"{input_prefix}.pv")):
+        command.extend(["--initValues", f"{input_prefix}.pv"])
+    return command
+
+
+def read_final_likelihood(replicate_dir, input_prefix):
+    bestlhoods_filepath = os.path.join(
+        replicate_dir, input_prefix, f"{input_prefix}.bestlhoods"
+    )
+    if not os.path.exists(bestlhoods_filepath):
+        return None
+    return warm_start_priors.read_bestlhoods(bestlhoods_filepath)[1]
+
+
+def run_replicates(
+    jobs,
+    input_prefix,
+    processes=1,
+    warmup_loops=10,
+    kill_margin=None,
+    likelihood_pattern=DEFAULT_LIKELIHOOD_PATTERN,
+    progress_file=None,
+    on_result=None,
+):
+    """
+    Runs every job (a dict with the model directory, replicate directory and command) with at most `processes`
+    at a time. Each line of a replicate's output (and of its progress_file, if given) that matches the likelihood
+    pattern counts as one loop. After warmup_loops, a replicate is stopped once its likelihood trails the best
+    likelihood that any replicate of the same model had after as many loops by more than kill_margin.
+    Returns one result per job, in order; each result is also passed to on_result (if given) as soon as its
+    replicate ends.
+    """
+    likelihood_regex = re.compile(likelihood_pattern)
+    selector = selectors.DefaultSelector()
+    pending_jobs = collections.deque(enumerate(jobs))
+    running = {}
+    results = [None] * len(jobs)
+    # per model, the best likelihood any of its replicates had reached after each number of loops
+    best_likelihoods_by_loop = collections.defaultdict(list)
+
+    # define nested functions
+    def record(job_index, status, loops, likelihood, reason):
+        job = jobs[job_index]
+        results[job_index] = {
+            "model_dir": job["model_dir"],
+            "replicate_dir": job["replicate_dir"],
+            "status": status,
+            "loops": loops,
+            "likelihood": likelihood,
+            "reason": reason,
+        }
+        if on_result is not None:
+            on_result(results[job_index])
+
+    def start(job_index, job):
+        try:
+            process = subprocess.Popen(
+                job["command"],
+                cwd=job["replicate_dir"],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+            )
+        except OSError as error:
+            # e.g. a missing executable, which fails this replicate only
+            record(job_index, "failed", 0, None, str(error))
+            return
+        state = {
+            "job_index": job_index,
+            "job": job,
+            "process": process,
+            "buffer": b"",
+            "progress_offset": 0,
+            "loops": 0,
+            "likelihood": None,
+            "killed_reason": None,
+        }
+        running[process.pid] = state
+        selector.register(process.stdout, selectors.EVENT_READ, state)
+
+    def read_lines(state, data):
+        state["buffer"] += data
+        *lines, state["buffer"] = state["buffer"].split(b"\n")
+        return lines
+
+    def track_likelihood(state, lines):
+        for line in lines:
+            match = likelihood_regex.search(line.decode(errors="replace"))
+            if not match:
+                continue
+            likelihood = float(match.group(1))
+            state["loops"] += 1
+            if state["likelihood"] is None or likelihood > state["likelihood"]:
+                state["likelihood"] = likelihood
+            best_likelihoods = best_likelihoods_by_loop[state["job"]["model_dir"]]
+            if len(best_likelihoods) < state["loops"]:
+                best_likelihoods.append(state["likelihood"])
+            elif state["likelihood"] > best_likelihoods[state["loops"] - 1]:
+                best_likelihoods[state["loops"] - 1] = state["likelihood"]
+
+    def read_progress_file(state):
+        progress_filepath = os.path.join(state["job"]["replicate_dir"], progress_file)
+        if not os.path.exists(progress_filepath):
+            return []
+        with open(progress_filepath, "rb") as progress:
+            progress.seek(state["progress_offset"])
+            data = progress.read()
+        # only complete lines are consumed
+        data = data[: data.rfind(b"\n") + 1]
+        state["progress_offset"] += len(data)
+        return data.splitlines()
+
+    def stop_trailing_replicates():
+        if kill_margin is None:
+            return
+        for state in running.values():
+            if (
+                state["killed_reason"]
+                or state["likelihood"] is None
+                or state["loops"] < warmup_loops
+            ):
+                continue
+            # compare replicates after the same number of loops, so that replicates started later are not penalised
+            best_likelihood = best_likelihoods_by_loop[state["job"]["model_dir"]][
+                state["loops"] - 1
+            ]
+            if state["likelihood"] < best_likelihood - kill_margin:
+                state["killed_reason"] = (
+                    f"likelihood {state['likelihood']:g} trailed the model's best {best_likelihood:g} "
+                    f"by more than {kill_margin:g} after {state['loops']} loops"
+                )
+                state["process"].kill()
+
+    def finish(state):
+        job = state["job"]
+        return_code = state["process"].wait()
+        if state["killed_reason"]:
+            status, reason = "killed", state["killed_reason"]
+        elif return_code != 0:
+            status, reason = "failed", f"exit code {return_code}"
+        else:
+            status, reason = "finished", ""
+            final_likelihood = read_final_likelihood(job["replicate_dir"], input_prefix)
+            if final_likelihood is not None:
+                state["likelihood"] = final_likelihood
+        record(state["job_index"], status, state["loops"], state["likelihood"], reason)
+
+    try:
+        while pending_jobs or running:
+            while pending_jobs and len(running) < processes:
+                start(*pending_jobs.popleft())
+
+            for key, _ in selector.select(timeout=0.5):
+                state = key.data
+                data = os.read(key.fd, 65536)
+                if data:
+                    track_likelihood(state, read_lines(state, data))
+                    continue
+
+                # the replicate has exited
+                selector.unregister(key.fileobj)
+                key.fileobj.close()
+                track_likelihood(state, [state["buffer"]])
+                if progress_file:
+                    track_likelihood(state, read_progress_file(state))
+                del running[state["process"].pid]
+                finish(state)
+
+            if progress_file:
+                for state in running.values():
+                    track_likelihood(state, read_progress_file(state))
+            stop_trailing_replicates()
+    finally:
+        # replicates still running (e.g. after an exception) are not left behind
+        for state in running.values():
+            state["process"].kill()
+            state["process"].wait()
+        selector.close()
+    return results
+
+
+def get_best_likelihoods(results):
+    # the best likelihood of every model over its replicates (None if no replicate reported one)
+    best_likelihoods = {}
+    for result in results:
+        best_likelihood = best_likelihoods.get(result["model_dir"])
+        if result["likelihood"] is not None and (
+            best_likelihood is None or result["likelihood"] > best_likelihood
+        ):
+            best_likelihood = result["likelihood"]
+        best_likelihoods[result["model_dir"]] = best_likelihood
+    return best_likelihoods
+
+
+def write_replicate_status(status_filepath, results):
+    with open(status_filepath, "w") as status_file:
+        status_file.write("replicate\tstatus\tloops\tlikelihood\treason\n")
+        for result in results:
+            likelihood = result["likelihood"]
+            status_file.write(
+                "\t".join(
+                    [
+                        os.path.basename(result["replicate_dir"]),
+                        result["status"],
+                        str(result["loops"]),
+                        "NA" if likelihood is None else f"{likelihood:g}",
+                        result["reason"],
+                    ]
+                )
+                + "\n"
+            )
+
+
+def run_model_replicates(
+    model_dirs,
+    input_prefix,
+    executable="fsc28",
+    arguments="-n 100000 -d -M -L 40 -q -c 1",
+    replicates=100,
+    processes=1,
+    warmup_loops=10,
+    kill_margin=None,
+    likelihood_pattern=DEFAULT_LIKELIHOOD_PATTERN,
+    progress_file=None,
+    replicate_prefix="run",
+    status_filename="replicate_status.tsv",
+):
+    # run_1 ... run_{replicates} in every model directory, all sharing one pool of processes
+    executable = resolve_executable(executable)
+    jobs = []
+    for model_dir in model_dirs:
+        for replicate in range(1, replicates + 1):
+            replicate_dir = setup_replicate_dir(
+                model_dir, input_prefix, f"{replicate_prefix}_{replicate}"
+            )
+            jobs.append(
+                {
+                    "model_dir": model_dir,
+                    "replicate_dir": replicate_dir,
+                    "command": get_fastsimcoal_command(
+                        replicate_dir, input_prefix, executable, arguments
+                    ),
+                }
+            )
+
+    results = run_replicates(
+        jobs,
+        input_prefix,
+        processes=processes,
+        warmup_loops=warmup_loops,
+        kill_margin=kill_margin,
+        likelihood_pattern=likelihood_pattern,
+        progress_file=progress_file,
+    )
+
+    # record how every replicate ended, per model
+    results_by_model = collections.defaultdict(list)
+    for result in results:
+        results_by_model[result["model_dir"]].append(result)
+    for model_dir, model_results in results_by_model.items():
+        write_replicate_status(os.path.join(model_dir, status_filename), model_results)
+    return results
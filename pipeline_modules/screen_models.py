@@ -0,0 +1,110 @@
+"""
+These functions screen the generated models by successive halving: every model first gets a cheap, short
+fastsimcoal fit, the worst fraction of the models (by AIC) is dropped, and the survivors get a larger budget,
+for a number of rounds
+"""
+
+import math
+import os
+
+from pipeline_modules import run_fastsimcoal
+from utilities import model_catalog  # type: ignore
+
+
+def get_aic(log10_likelihood, num_params):
+    # fastsimcoal reports log10 likelihoods
+    if log10_likelihood is None:
+        return math.inf
+    return 2 * num_params - 2 * log10_likelihood * math.log(10)
+
+
+def write_round_ranking(ranking_filepath, ranking, num_kept):
+    with open(ranking_filepath, "w") as ranking_file:
+        ranking_file.write("rank\tmodel\tlikelihood\tnum_params\taic\tstatus\n")
+        for rank, (model_dir, likelihood, num_params, aic) in enumerate(
+            ranking, start=1
+        ):
+            ranking_file.write(
+                "\t".join(
+                    [
+                        str(rank),
+                        model_dir,
+                        "NA" if likelihood is None else f"{likelihood:g}",
+                        str(num_params),
+                        "NA" if math.isinf(aic) else f"{aic:.4f}",
+                        "kept" if rank <= num_kept else "dropped",
+                    ]
+                )
+                + "\n"
+            )
+
+
+def screen_models(
+    model_dirs,
+    output_dir,
+    input_prefix,
+    fastsimcoal_params,
+    rounds=3,
+    drop_fraction=0.5,
+    num_simulations=10000,
+    num_loops=10,
+    budget_factor=2,
+    replicates=2,
+    arguments="-d -M -q -c 1",
+):
+    # the number of estimated parameters of every model, for its AIC
+    num_params = {
+        model_dir: model_catalog.count_est_params(
+            os.path.join(model_dir, f"{input_prefix}.est")
+        )
+        for model_dir in model_dirs
+    }
+
+    surviving_model_dirs = list(model_dirs)
+    for screening_round in range(1, rounds + 1):
+        # every round raises the budget (number of simulations and ECM loops) of the surviving models
+        round_budget = budget_factor ** (screening_round - 1)
+        round_arguments = (
+            f"-n {int(num_simulations * round_budget)} "
+            f"-L {int(num_loops * round_budget)} {arguments}"
+        )
+        print(
+            f"Screening round {screening_round}: {len(surviving_model_dirs)} models, {round_arguments}"
+        )
+
+        # all rounds share the same scheduler (and its stopping of trailing replicates)
+        results = run_fastsimcoal.run_model_replicates(
+            surviving_model_dirs,
+            input_prefix,
+            arguments=round_arguments,
+            replicates=replicates,
+            replicate_prefix=f"screen_{screening_round}",
+            status_filename=f"screening_round_{screening_round}_replicates.tsv",
+            **fastsimcoal_params,
+        )
+        best_likelihoods = run_fastsimcoal.get_best_likelihoods(results)
+
+        # rank by AIC (stable, so ties keep their model order), models without a likelihood rank last
+        ranking = sorted(
+            (
+                (
+                    model_dir,
+                    best_likelihoods.get(model_dir),
+                    num_params[model_dir],
+                    get_aic(best_likelihoods.get(model_dir), num_params[model_dir]),
+                )
+                for model_dir in surviving_model_dirs
+            ),
+            key=lambda ranked_model: ranked_model[3],
+        )
+        num_kept = len(ranking)
+        if screening_round < rounds:
+            num_kept = max(1, math.ceil(len(ranking) * (1 - drop_fraction)))
+        write_round_ranking(
+            os.path.join(output_dir, f"screening_round_{screening_round}.tsv"),
+            ranking,
+            num_kept,
+        )
+        surviving_model_dirs = [model_dir for model_dir, *_ in ranking[:num_kept]]
+
+    return surviving_model_dirs
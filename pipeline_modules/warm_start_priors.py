@@ -0,0 +1,212 @@
+"""
+These functions warm-start the est of a new model from the fastsimcoal estimates (.bestlhoods) of an already-fitted
+model with the same structure (same divergence events, N_POP and MIG parameters): the priors of the shared
+parameters are narrowed around the fitted values, and/or an initial-values (.pv) file is written for fastsimcoal
+"""
+
+import glob
+import os
+import re
+
+from utilities import model_catalog  # type: ignore
+
+
+def read_bestlhoods(bestlhoods_filepath):
+    # a header of parameter names (without "$") followed by MaxEstLhood/MaxObsLhood, and one line of values
+    with open(bestlhoods_filepath, "r") as bestlhoods_file:
+        lines = [line.split() for line in bestlhoods_file if line.strip()]
+    names, values = lines[0], [float(value) for value in lines[-1]]
+    estimates = dict(zip(names, values))
+    likelihood = estimates.pop("MaxEstLhood", float("-inf"))
+    estimates.pop("MaxObsLhood", None)
+    return {f"{name}$": value for name, value in estimates.items()}, likelihood
+
+
+def get_model_structure(tpl_lines):
+    # divergence events, N_POP and MIG parameters decide which fitted models are related
+    features = model_catalog.read_tpl_features(tpl_lines)
+    tpl = "\n".join(tpl_lines)
+    return (
+        # the same divergences in another order are another tree, and the time chain follows this order
+        tuple(
+            event["name"]
+            for event in features["events"]
+            if event["event_type"] == "DIV"
+        ),
+        frozenset(re.findall(r"\bN_POP\w+\$", tpl)),
+        frozenset(re.findall(r"\bMIG\w+\$", tpl)),
+    )
+
+
+def find_model_tpl(bestlhoods_filepath, input_prefix):
+    # fastsimcoal writes its results to a subdirectory of the model directory, e.g. random_model_3/hom_sap/
+    directory = os.path.dirname(os.path.abspath(bestlhoods_filepath))
+    while True:
+        tpl_filepath = os.path.join(directory, f"{input_prefix}.tpl")
+        if os.path.exists(tpl_filepath):
+            # replicate directories link the model's tpl, so that all replicates map to the same model
+            return os.path.realpath(tpl_filepath)
+        parent_directory = os.path.dirname(directory)
+        if parent_directory == directory:
+            return None
+        directory = parent_directory
+
+
+def read_fitted_models(fitted_dirs, input_prefix):
+    # index the best fit of every fitted model by its divergence events
+    best_fits = {}
+    for fitted_dir in fitted_dirs:
+        for bestlhoods_filepath in glob.glob(
+            os.path.join(
+                os.path.expanduser(fitted_dir), "**", f"{input_prefix}.bestlhoods"
+            ),
+            recursive=True,
+        ):
+            # bootstrap refits are fits to simulated data, not to the observed SFS
+            relative_path = os.path.relpath(
+                bestlhoods_filepath, os.path.expanduser(fitted_dir)
+            )
+            if "bootstrap" in relative_path.split(os.sep):
+                continue
+            tpl_filepath = find_model_tpl(bestlhoods_filepath, input_prefix)
+            if tpl_filepath is None:
+                print(f"Warning: no {input_prefix}.tpl found for {bestlhoods_filepath}")
+                continue
+            estimates, likelihood = read_bestlhoods(bestlhoods_filepath)
+            # keep the best of several fastsimcoal replicates of the same model
+            if (
+                tpl_filepath not in best_fits
+                or likelihood > best_fits[tpl_filepath]["likelihood"]
+            ):
+                best_fits[tpl_filepath] = {
+                    "path": bestlhoods_filepath,
+                    "likelihood": likelihood,
+                    "estimates": estimates,
+                }
+
+    fitted_models = {}
+    for tpl_filepath, fit in best_fits.items():
+        with open(tpl_filepath, "r") as tpl_file:
+            tpl_lines = tpl_file.read().splitlines()
+        div_events, pop_size_params, migration_params = get_model_structure(tpl_lines)
+        fit["pop_size_params"] = pop_size_params
+        fit["migration_params"] = migration_params
+        fitted_models.setdefault(div_events, []).append(fit)
+    return fitted_models
+
+
+def find_related_fit(tpl_lines, fitted_models):
+    # the related fit shares every divergence event, and as many N_POP/MIG parameters as possible
+    div_events, pop_size_params, migration_params = get_model_structure(tpl_lines)
+    candidates = fitted_models.get(div_events, [])
+    if not candidates:
+        return None
+    return max(
+        candidates,
+        key=lambda fit: (
+            len(fit["pop_size_params"] & pop_size_params)
+            + len(fit["migration_params"] & migration_params),
+            fit["likelihood"],
+        ),
+    )
+
+
+def get_warm_start_values(est_lines, estimates):
+    # fitted values of the est's simple params, including the hidden times between successive events
+    warm_start_values = {}
+    section = None
+    for line in est_lines:
+        if line.startswith("["):
+            section = line.strip()
+        elif section == "[COMPLEX PARAMETERS]" and line.strip():
+            # e.g. "1 T_DIV12$ = T_1_2$ + T_ADMIX12$ output"
+            match = re.match(r"\d (T_\w+\$) = (T_\d+_\d+\$) \+ (T_\w+\$)", line)
+            if match:
+                event, between_events, previous_event = match.groups()
+                if event in estimates and previous_event in estimates:
+                    warm_start_values[between_events] = (
+                        estimates[event] - estimates[previous_event]
+                    )
+
+    for name, value in estimates.items():
+        warm_start_values.setdefault(name, value)
+    return warm_start_values
+
+
+def narrow_prior(dist_min, dist_max, value, narrow_factor):
+    # narrow the prior to [value / factor, value * factor], within the user's prior range
+    value = min(max(value, dist_min), dist_max)
+    return max(dist_min, value / narrow_factor), min(dist_max, value * narrow_factor)
+
+
+def format_value(value, is_int):
+    return str(int(round(value))) if is_int else f"{value:.6g}"
+
+
+def warm_start_est_lines(est_lines, fit, narrow_factor=2.0, mode="narrow"):
+    # returns the warm-started est lines, and the initial values (None unless requested)
+    if mode not in ["narrow", "initial_values", "both"]:
+        raise ValueError(f"Unsupported WARM_START mode: {mode}")
+
+    est_lines = list(est_lines)
+    warm_start_values = get_warm_start_values(est_lines, fit["estimates"])
+
+    initial_values = []
+    section = None
+    for line_index, line in enumerate(est_lines):
+        if line.startswith("["):
+            section = line.strip()
+            continue
+        if section != "[PARAMETERS]" or not line.strip() or line.startswith("//"):
+            continue
+
+        # e.g. "1 T_DIV21$ unif 10.0e0 10.0e5 output"
+        is_int, name, dist, dist_min, dist_max, *rest = line.split()
+        is_int = is_int == "1"
+        dist_min, dist_max = float(dist_min), float(dist_max)
+        if name in warm_start_values and warm_start_values[name] > 0:
+            value = min(max(warm_start_values[name], dist_min), dist_max)
+            if mode in ["narrow", "both"] and dist_min < dist_max:
+                new_min, new_max = narrow_prior(
+                    dist_min, dist_max, value, narrow_factor
+                )
+                est_lines[line_index] = " ".join(
+                    [
+                        "1" if is_int else "0",
+                        name,
+                        dist,
+                        format_value(new_min, is_int),
+                        format_value(new_max, is_int),
+                    ]
+                    + rest
+                )
+        elif dist == "logunif":
+            value = (dist_min * dist_max) ** 0.5
+        else:
+            value = (dist_min + dist_max) / 2
+        initial_values.append((name, format_value(value, is_int)))
+
+    # record where the warm start came from
+    est_lines.insert(
+        est_lines.index("[PARAMETERS]") + 1,
+        f"//warm-started from {fit['path']} (MaxEstLhood {fit['likelihood']:g})",
+    )
+
+    if mode not in ["initial_values", "both"]:
+        initial_values = None
+    return est_lines, initial_values
+
+
+def format_initial_values(initial_values):
+    # initial values in the same layout as the .bestlhoods file, e.g. for fsc --initValues hom_sap.pv
+    return (
+        "\t".join(name.rstrip("$") for name, _ in initial_values)
+        + "\n"
+        + "\t".join(value for _, value in initial_values)
+        + "\n"
+    )
+
+
+def write_initial_values(pv_filepath, initial_values):
+    with open(pv_filepath, "w") as pv_file:
+        pv_file.write(format_initial_values(initial_values))
@@ -0,0 +1,50 @@
+import os
+import random
+import shutil
+import sys
+
+import pytest
+
+# the pipeline modules are imported from the repository root, as coalminer.py does
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pipeline_modules import generate_random_est, generate_random_tpl  # noqa: E402
+
+MODEL_PARAMS = {
+    "mutation_rate_dist": {"min": 1.29e-08, "max": 1.29e-08, "type": "unif"},
+    "effective_pop_size_dist": {"min": 1000, "max": 10000, "type": "unif"},
+    "migration_dist": {"min": 0.001, "max": 0.1, "type": "unif"},
+    "time_dist": {"min": 10.0, "max": 1.0e5, "type": "unif"},
+    "max_time_between_events": 1000,
+}
+
+
+@pytest.fixture
+def fsc_stub(tmp_path, monkeypatch):
+    # the stub fastsimcoal, copied next to the working directory and referred to by a relative path
+    shutil.copy(
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), "fsc_stub.py"),
+        tmp_path / "fsc_stub.py",
+    )
+    monkeypatch.chdir(tmp_path)
+    return os.path.join(".", "fsc_stub.py")
+
+
+@pytest.fixture
+def model_dirs(tmp_path):
+    # three random 3-population models, laid out as coalminer.py writes them
+    random.seed(1)
+    output_dir = tmp_path / "output"
+    model_dirs = []
+    for model in range(1, 4):
+        model_dir = output_dir / f"random_model_{model}"
+        model_dir.mkdir(parents=True)
+        tpl_lines = generate_random_tpl.get_random_tpl_lines(3, [10, 10, 10])
+        generate_random_tpl.write_tpl(str(model_dir / "hom_sap.tpl"), tpl_lines)
+        generate_random_est.write_est(
+            generate_random_est.get_random_est_lines(tpl_lines, **MODEL_PARAMS),
+            str(model_dir / "hom_sap.est"),
+        )
+        (model_dir / "hom_sap_jointMAFpop1_0.obs").write_text("1 observations\n")
+        model_dirs.append(str(model_dir))
+    return model_dirs
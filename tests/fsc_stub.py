@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+A stand-in for the fastsimcoal executable, for the tests. Fitting (-t prefix.tpl -e prefix.est -L loops)
+prints one MaxEstLhood line per loop, converging to a likelihood that gets worse with the replicate number
+(run_1 best), and writes prefix/prefix.bestlhoods with every output parameter of the est. Simulating
+(-i prefix.par -n N -j) writes one obs file per simulated data set to prefix/prefix_{n}/
+"""
+
+import os
+import re
+import sys
+import time
+
+
+def simulate(arguments):
+    prefix = arguments[arguments.index("-i") + 1][: -len(".par")]
+    for replicate in range(1, int(arguments[arguments.index("-n") + 1]) + 1):
+        replicate_dir = os.path.join(prefix, f"{prefix}_{replicate}")
+        os.makedirs(replicate_dir, exist_ok=True)
+        with open(
+            os.path.join(replicate_dir, f"{prefix}_jointMAFpop1_0.obs"), "w"
+        ) as obs_file:
+            obs_file.write(f"1 observations\n{replicate}\n")
+
+
+def fit(arguments):
+    prefix = arguments[arguments.index("-t") + 1][: -len(".tpl")]
+    loops = int(arguments[arguments.index("-L") + 1]) if "-L" in arguments else 20
+    replicate_number = int(re.sub(r"\D", "", os.path.basename(os.getcwd())) or 1)
+    target = -1000.0 - 100 * (replicate_number - 1)
+
+    os.makedirs(prefix, exist_ok=True)
+    for loop in range(1, loops + 1):
+        print(f"Loop {loop}: MaxEstLhood = {target - 500 / loop:.3f}", flush=True)
+        time.sleep(0.01)
+
+    # every output parameter is estimated at the middle of its prior (complex parameters at 1)
+    names, values = [], []
+    with open(f"{prefix}.est", "r") as est_file:
+        for line in est_file:
+            fields = line.split()
+            if len(fields) >= 5 and fields[-1] == "output":
+                names.append(fields[1].rstrip("$"))
+                is_complex = fields[2] == "="
+                values.append(
+                    1.0 if is_complex else (float(fields[3]) + float(fields[4])) / 2
+                )
+    with open(os.path.join(prefix, f"{prefix}.bestlhoods"), "w") as bestlhoods_file:
+        bestlhoods_file.write("\t".join(names + ["MaxEstLhood", "MaxObsLhood"]) + "\n")
+        bestlhoods_file.write(
+            "\t".join(f"{value:g}" for value in values + [target, target + 50]) + "\n"
+        )
+
+
+if __name__ == "__main__":
+    if "-i" in sys.argv[1:]:
+        simulate(sys.argv[1:])
+    else:
+        fit(sys.argv[1:])
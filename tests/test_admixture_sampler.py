@@ -0,0 +1,151 @@
+import collections
+import math
+import random
+
+import numpy as np
+import pytest
+
+from pipeline_modules import batch_random_tpl, generate_random_tpl
+
+
+def old_admix_source_and_sink(ghost_present, number_of_populations):
+    # the retry-loop sampler that get_admix_source_and_sink replaced, kept as the reference distribution
+    def add_source_or_sink(possible_sources_or_sinks):
+        sources_or_sinks = []
+        for _ in range(random.randint(1, number_of_populations)):
+            if possible_sources_or_sinks == []:
+                break
+            new_source_or_sink = random.choice(possible_sources_or_sinks)
+            sources_or_sinks.append(str(new_source_or_sink))
+            possible_sources_or_sinks.remove(new_source_or_sink)
+        return sources_or_sinks
+
+    sources, sinks = [], []
+    while sources == sinks:
+        possible_sources = list(range(number_of_populations))
+        possible_sinks = list(range(number_of_populations))
+        if ghost_present:
+            possible_sources.pop(-1)
+            possible_sinks.pop(-1)
+            if random.choice([True, False]):
+                possible_sources.append("G")
+            else:
+                possible_sinks.append("G")
+        sources.extend(add_source_or_sink(possible_sources))
+        sinks.extend(add_source_or_sink(possible_sinks))
+
+    while True:
+        source = random.choice(sources)
+        sink = random.choice(sinks)
+        if source != sink:
+            return source, sink
+
+
+def chi_square_critical_value(degrees_of_freedom, z=3.29):
+    # Wilson-Hilferty approximation of the chi-square quantile (z = 3.29 for a 0.0005 upper tail)
+    return (
+        degrees_of_freedom
+        * (
+            1
+            - 2 / (9 * degrees_of_freedom)
+            + z * math.sqrt(2 / (9 * degrees_of_freedom))
+        )
+        ** 3
+    )
+
+
+def assert_same_distribution(old_counts, new_counts):
+    # chi-square test of homogeneity of two samples of (source, sink) pairs
+    categories = sorted(set(old_counts) | set(new_counts))
+    old_total = sum(old_counts.values())
+    new_total = sum(new_counts.values())
+    statistic = 0.0
+    for category in categories:
+        pooled = old_counts[category] + new_counts[category]
+        for counts, total in [(old_counts, old_total), (new_counts, new_total)]:
+            expected = pooled * total / (old_total + new_total)
+            statistic += (counts[category] - expected) ** 2 / expected
+    assert statistic < chi_square_critical_value(len(categories) - 1), (
+        statistic,
+        old_counts,
+        new_counts,
+    )
+
+
+def get_ghost_fraction(counts):
+    return sum(count for pair, count in counts.items() if "G" in pair) / sum(
+        counts.values()
+    )
+
+
+@pytest.mark.parametrize(
+    "ghost_present, number_of_populations",
+    [(True, 2), (True, 3), (True, 4), (True, 6), (False, 2), (False, 4)],
+)
+def test_admix_source_and_sink_matches_old_sampler(
+    ghost_present, number_of_populations
+):
+    num_draws = 40000
+    random.seed(1)
+    old_counts = collections.Counter(
+        old_admix_source_and_sink(ghost_present, number_of_populations)
+        for _ in range(num_draws)
+    )
+    new_counts = collections.Counter(
+        generate_random_tpl.get_admix_source_and_sink(
+            ghost_present, number_of_populations
+        )
+        for _ in range(num_draws)
+    )
+    assert_same_distribution(old_counts, new_counts)
+
+
+@pytest.mark.parametrize("number_of_populations", [3, 4, 6])
+def test_batch_admixture_pairs_match_old_sampler(number_of_populations):
+    num_draws = 40000
+    random.seed(2)
+    old_counts = collections.Counter(
+        old_admix_source_and_sink(True, number_of_populations) for _ in range(num_draws)
+    )
+    sources, sinks = batch_random_tpl.draw_admixture_pairs(
+        np.random.default_rng(2), (num_draws,), number_of_populations, True
+    )
+    ghost = number_of_populations - 1
+    new_counts = collections.Counter(
+        (
+            "G" if source == ghost else str(source),
+            "G" if sink == ghost else str(sink),
+        )
+        for source, sink in zip(sources.tolist(), sinks.tolist())
+    )
+    assert_same_distribution(old_counts, new_counts)
+
+
+def test_ghost_fraction_with_appended_identical_attempts():
+    # with 3 demes (2 real and a ghost), the appended identical attempts lower the ghost fraction to ~45.7%,
+    # against ~46.7% if identical attempts were redrawn from scratch
+    random.seed(3)
+    counts = collections.Counter(
+        generate_random_tpl.get_admix_source_and_sink(True, 3) for _ in range(200000)
+    )
+    assert abs(get_ghost_fraction(counts) - 0.457) < 0.005
+
+
+def test_admixture_without_two_populations_raises():
+    with pytest.raises(ValueError):
+        generate_random_tpl.get_admix_source_and_sink(False, 1)
+
+
+def test_single_population_models_skip_admixture():
+    # without a ghost, a single population has nothing to admix with, so its models have no admixture events
+    random.seed(1)
+    tpl_lines = [
+        generate_random_tpl.get_random_tpl_lines(1, [10], max_admix_events=3)
+        for _ in range(20)
+    ]
+    tpl_lines += batch_random_tpl.get_random_tpl_lines_batch(
+        1, [10], 20, max_admix_events=3, seed=1
+    )
+    for lines in tpl_lines:
+        if "N_POPG$" not in lines:
+            assert not any(line.startswith("T_ADMIX") for line in lines)
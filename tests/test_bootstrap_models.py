@@ -0,0 +1,70 @@
+import os
+
+from pipeline_modules import bootstrap_models, run_fastsimcoal, warm_start_priors
+
+
+def read_tsv(filepath):
+    with open(filepath, "r") as tsv_file:
+        header, *rows = [line.rstrip("\n").split("\t") for line in tsv_file]
+    return [dict(zip(header, row)) for row in rows]
+
+
+def test_bootstrap_top_models(fsc_stub, model_dirs, tmp_path):
+    run_fastsimcoal.run_model_replicates(
+        model_dirs,
+        "hom_sap",
+        executable=fsc_stub,
+        arguments="-L 3",
+        replicates=2,
+        processes=3,
+    )
+
+    bootstrapped = bootstrap_models.bootstrap_models(
+        model_dirs,
+        str(tmp_path / "output"),
+        "hom_sap",
+        {"executable": fsc_stub, "processes": 3},
+        top=2,
+        num_bootstraps=5,
+        refit_arguments="-L 3",
+        refit_replicates=2,
+    )
+
+    assert len(bootstrapped) == 2
+    ci_rows = read_tsv(tmp_path / "output" / "bootstrap_ci.tsv")
+    assert {row["model"] for row in ci_rows} == set(bootstrapped)
+    for model_dir in bootstrapped:
+        bootstrap_dir = os.path.join(model_dir, "bootstrap")
+        estimates = read_tsv(os.path.join(bootstrap_dir, "bootstrap_estimates.tsv"))
+        # rows are written as the refits end, which varies from run to run
+        assert sorted(int(row["replicate"]) for row in estimates) == list(range(1, 6))
+        # the best of the two refits of every bootstrap replicate is kept
+        assert {row["MaxEstLhood"] for row in estimates} == {"-1000"}
+        model_ci_rows = read_tsv(os.path.join(bootstrap_dir, "bootstrap_ci.tsv"))
+        assert {row["num_bootstraps"] for row in model_ci_rows} == {"5"}
+        assert os.path.islink(os.path.join(bootstrap_dir, "rep_1", "hom_sap.tpl"))
+        assert os.path.islink(
+            os.path.join(bootstrap_dir, "rep_1", "hom_sap_jointMAFpop1_0.obs")
+        )
+
+    # the refits of simulated SFS are neither warm starts nor the model's own fit, even when they fit better
+    for model_dir in bootstrapped:
+        refit_filepath = os.path.join(
+            model_dir, "bootstrap", "rep_1", "run_1", "hom_sap", "hom_sap.bestlhoods"
+        )
+        with open(refit_filepath, "r") as refit_file:
+            header, values = refit_file.read().splitlines()
+        values = values.split("\t")
+        values[header.split("\t").index("MaxEstLhood")] = "-10"
+        with open(refit_filepath, "w") as refit_file:
+            refit_file.write(header + "\n" + "\t".join(values) + "\n")
+    fitted_models = warm_start_priors.read_fitted_models(
+        [str(tmp_path / "output")], "hom_sap"
+    )
+    fits = [fit for fits in fitted_models.values() for fit in fits]
+    assert len(fits) == 3
+    assert not any("bootstrap" in fit["path"].split(os.sep) for fit in fits)
+    for model_dir in bootstrapped:
+        assert bootstrap_models.find_best_fit(model_dir, "hom_sap")["path"] == (
+            os.path.join(model_dir, "run_1", "hom_sap", "hom_sap.bestlhoods")
+        )
@@ -0,0 +1,39 @@
+import shutil
+
+from pipeline_modules import job_batches
+
+
+def test_runtimes_are_paired_with_the_measured_model(model_dirs, tmp_path, monkeypatch):
+    # an earlier output directory, whose random_model_1 is the current random_model_2
+    earlier_model_dir = tmp_path / "earlier_output" / "random_model_1"
+    shutil.copytree(model_dirs[1], earlier_model_dir)
+    monkeypatch.chdir(tmp_path)
+
+    sfs_size_cache = {}
+    features = [
+        job_batches.get_model_features(model_dir, "hom_sap", sfs_size_cache)
+        for model_dir in model_dirs
+    ]
+    assert features[0] != features[1]
+    runtimes_filepath = tmp_path / "runtimes.tsv"
+    runtimes_filepath.write_text(
+        "model\truntime\n"
+        f"{earlier_model_dir}\t100\n"
+        "earlier_output/random_model_1\t200\n"
+        "random_model_3\t300\n"
+        "random_model_9\t400\n"
+    )
+
+    measured = job_batches.get_runtime_features(
+        job_batches.read_runtimes(runtimes_filepath),
+        model_dirs,
+        features,
+        "hom_sap",
+        sfs_size_cache,
+    )
+    # the listed directories are read, a bare name falls back to the current model, unknown names are skipped
+    assert [model_features for model_features, _ in measured] == [
+        features[1],
+        features[1],
+        features[2],
+    ]
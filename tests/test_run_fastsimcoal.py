@@ -0,0 +1,87 @@
+import os
+
+from pipeline_modules import run_fastsimcoal
+
+
+def read_status(model_dir):
+    with open(os.path.join(model_dir, "replicate_status.tsv"), "r") as status_file:
+        header, *rows = [line.rstrip("\n").split("\t") for line in status_file]
+    return [dict(zip(header, row)) for row in rows]
+
+
+def test_replicates_finish_with_relative_executable(fsc_stub, model_dirs):
+    results = run_fastsimcoal.run_model_replicates(
+        model_dirs,
+        "hom_sap",
+        executable=fsc_stub,
+        arguments="-n 1000 -d -M -L 5 -q",
+        replicates=2,
+        processes=3,
+    )
+
+    assert [result["status"] for result in results] == ["finished"] * 6
+    assert run_fastsimcoal.get_best_likelihoods(results) == {
+        model_dir: -1000.0 for model_dir in model_dirs
+    }
+    for model_dir in model_dirs:
+        assert [row["status"] for row in read_status(model_dir)] == ["finished"] * 2
+        # the model's files are linked, not copied
+        assert os.path.islink(os.path.join(model_dir, "run_1", "hom_sap.tpl"))
+
+
+def test_trailing_replicates_are_killed(fsc_stub, model_dirs):
+    # run_1 converges to the best likelihood, and runs first; the other replicates trail it by 100+
+    results = run_fastsimcoal.run_model_replicates(
+        model_dirs[:1],
+        "hom_sap",
+        executable=fsc_stub,
+        arguments="-L 30",
+        replicates=3,
+        processes=1,
+        warmup_loops=3,
+        kill_margin=50,
+    )
+
+    assert [result["status"] for result in results] == ["finished", "killed", "killed"]
+    for result in results[1:]:
+        assert 3 <= result["loops"] < 30
+        assert "trailed" in result["reason"]
+
+
+def test_missing_executable_fails_replicates(fsc_stub, model_dirs):
+    on_result_statuses = []
+    results = run_fastsimcoal.run_replicates(
+        [
+            {
+                "model_dir": model_dirs[0],
+                "replicate_dir": run_fastsimcoal.setup_replicate_dir(
+                    model_dirs[0], "hom_sap", "run_1"
+                ),
+                "command": [os.path.abspath("missing_fsc"), "-t", "hom_sap.tpl"],
+            }
+        ],
+        "hom_sap",
+        on_result=lambda result: on_result_statuses.append(result["status"]),
+    )
+    assert results[0]["status"] == "failed"
+    assert on_result_statuses == ["failed"]
+
+    # run_model_replicates still records every replicate
+    run_fastsimcoal.run_model_replicates(
+        model_dirs[:1], "hom_sap", executable="./missing_fsc", replicates=2
+    )
+    assert [row["status"] for row in read_status(model_dirs[0])] == ["failed"] * 2
+
+
+def test_warm_started_replicates_pass_initial_values(tmp_path):
+    command = run_fastsimcoal.get_fastsimcoal_command(
+        str(tmp_path), "hom_sap", "fsc28", "-n 1000"
+    )
+    assert "--initValues" not in command
+
+    (tmp_path / "hom_sap.pv").write_text("N_POP0\n1000\n")
+    command = run_fastsimcoal.get_fastsimcoal_command(
+        str(tmp_path), "hom_sap", "fsc28", "-n 1000"
+    )
+    # fastsimcoal's option is spelled --initValues
+    assert command[-2:] == ["--initValues", "hom_sap.pv"]
@@ -0,0 +1,53 @@
+from pipeline_modules import warm_start_priors
+
+
+def get_tpl_lines(events):
+    # three demes without migration, diverging by the given events
+    return [
+        "//Number of population samples (demes)",
+        "3",
+        "//Population effective sizes (number of genes)",
+        "N_POP0$",
+        "N_POP1$",
+        "N_POP2$",
+        "//Sample Sizes",
+        "10",
+        "10",
+        "10",
+        "//Growth rates : negative growth implies population expansion",
+        "0",
+        "0",
+        "0",
+        "//Number of migration matrices : 0 implies no migration between demes",
+        "0",
+        "//historical event: time, source, sink, migrants, new deme size, growth rate, migr mat index",
+        f"{len(events)} historical event",
+        *events,
+        "//Number of independent loci [chromosome]",
+        "1 0",
+    ]
+
+
+def test_related_fit_needs_the_same_divergence_order():
+    # ((0,1),2) and ((2,1),0) share their divergence events, but not their order
+    div_01_first = get_tpl_lines(
+        ["T_DIV01$ 0 1 1 RELANC01$ 0 0", "T_DIV21$ 2 1 1 RELANC21$ 0 0"]
+    )
+    div_21_first = get_tpl_lines(
+        ["T_DIV21$ 2 1 1 RELANC21$ 0 0", "T_DIV01$ 0 1 1 RELANC01$ 0 0"]
+    )
+    div_events, pop_size_params, migration_params = (
+        warm_start_priors.get_model_structure(div_01_first)
+    )
+    assert div_events == ("T_DIV01$", "T_DIV21$")
+
+    fit = {
+        "path": "random_model_1/run_1/hom_sap/hom_sap.bestlhoods",
+        "likelihood": -1000.0,
+        "estimates": {"T_DIV01$": 100.0, "T_DIV21$": 500.0},
+        "pop_size_params": pop_size_params,
+        "migration_params": migration_params,
+    }
+    fitted_models = {div_events: [fit]}
+    assert warm_start_priors.find_related_fit(div_01_first, fitted_models) is fit
+    assert warm_start_priors.find_related_fit(div_21_first, fitted_models) is None
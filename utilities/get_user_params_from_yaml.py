@@ -1,6 +1,51 @@
+import copy
+import itertools
+import os
+
 import yaml
 
 def read_yaml_file(file_path):
     with open(file_path, 'r') as file:
         params = yaml.safe_load(file)
-    return params
\ No newline at end of file
+    return params
+
+
+def set_param(params, dotted_key, value):
+    # nested values are addressed with dots, e.g. MODEL_PARAMS.time_dist
+    keys = dotted_key.split(".")
+    for key in keys[:-1]:
+        params = params.setdefault(key, {})
+    params[keys[-1]] = value
+
+
+def expand_sweep(params):
+    # a SWEEP section expands one config into several: a mapping of lists is swept as a grid,
+    # a list of mappings gives one config per entry
+    sweep = params.get("SWEEP")
+    if not sweep:
+        return [params]
+
+    base_params = {key: value for key, value in params.items() if key != "SWEEP"}
+    if isinstance(sweep, dict):
+        keys = list(sweep)
+        overrides = [
+            dict(zip(keys, values))
+            for values in itertools.product(*(sweep[key] for key in keys))
+        ]
+    elif isinstance(sweep, list):
+        overrides = sweep
+    else:
+        raise ValueError("SWEEP must be a mapping of lists or a list of mappings")
+
+    swept_params = []
+    for i, override in enumerate(overrides, start=1):
+        config_params = copy.deepcopy(base_params)
+        for dotted_key, value in override.items():
+            set_param(config_params, dotted_key, value)
+        # every config gets its own output directory, unless the sweep sets one
+        if "OUTPUT_DIR" not in override:
+            config_params["OUTPUT_DIR"] = os.path.join(
+                base_params.get("OUTPUT_DIR", "output"), f"sweep_{i}"
+            )
+        swept_params.append(config_params)
+    return swept_params
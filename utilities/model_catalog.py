@@ -0,0 +1,330 @@
+"""
+An indexed SQLite catalog of generated models, so models can be queried by their features
+(ghost, migration, events, ...) without opening every tpl/est.
+
+Example usage:
+    python3 utilities/model_catalog.py import models.sqlite hom_sap_models hom_sap
+    python3 utilities/model_catalog.py query models.sqlite --ghost --admix-into 2
+"""
+
+import argparse
+import glob
+import hashlib
+import os
+import re
+import sqlite3
+import sys
+
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS models (
+        id INTEGER PRIMARY KEY,
+        path TEXT UNIQUE NOT NULL,
+        num_demes INTEGER,
+        ghost INTEGER,
+        migration INTEGER,
+        migration_varies_by_matrix INTEGER,
+        num_events INTEGER,
+        event_order TEXT,
+        admixture INTEGER,
+        bottleneck INTEGER,
+        num_est_params INTEGER,
+        canonical_hash TEXT
+    )""",
+    """CREATE TABLE IF NOT EXISTS events (
+        model_id INTEGER NOT NULL REFERENCES models(id) ON DELETE CASCADE,
+        position INTEGER,
+        event_type TEXT,
+        source TEXT,
+        sink TEXT
+    )""",
+    "CREATE INDEX IF NOT EXISTS models_features ON models (ghost, migration, admixture, bottleneck)",
+    "CREATE INDEX IF NOT EXISTS models_hash ON models (canonical_hash)",
+    "CREATE INDEX IF NOT EXISTS events_by_source ON events (event_type, source)",
+    "CREATE INDEX IF NOT EXISTS events_by_sink ON events (event_type, sink)",
+    "CREATE INDEX IF NOT EXISTS events_by_model ON events (model_id)",
+]
+
+EVENT_TYPE_PATTERN = r"^T_(DIV|ADMIX|BOTEND|BOT)"
+
+
+def open_catalog(catalog_filepath):
+    connection = sqlite3.connect(catalog_filepath)
+    connection.execute("PRAGMA journal_mode = WAL")
+    connection.execute("PRAGMA foreign_keys = ON")
+    for statement in SCHEMA:
+        connection.execute(statement)
+    return connection
+
+
+def get_population_id(population_label):
+    return population_label if population_label == "G" else str(int(population_label))
+
+
+def read_tpl_features(tpl_lines):
+    # walk the tpl once, using the section headers written by generate_random_tpl.write_tpl
+    num_demes = int(tpl_lines[1])
+    population_sizes = tpl_lines[3 : 3 + num_demes]
+    sample_sizes = tpl_lines[4 + num_demes : 4 + 2 * num_demes]
+
+    num_matrices = 0
+    events = []
+    migration_varies_by_matrix = False
+    for line_index, line in enumerate(tpl_lines):
+        if line.startswith("//Number of migration matrices"):
+            num_matrices = int(tpl_lines[line_index + 1])
+        elif line.endswith("historical event"):
+            num_events = int(line.split()[0])
+            events = tpl_lines[line_index + 1 : line_index + 1 + num_events]
+            break
+        elif not migration_varies_by_matrix and re.search(r"MIG\w+_\d+\$", line):
+            migration_varies_by_matrix = True
+
+    # population ids by deme index, without the zero-padding used in parameter names (e.g. "2", "G")
+    population_labels = [
+        get_population_id(size[len("N_POP") : -1]) for size in population_sizes
+    ]
+
+    parsed_events = []
+    for event in events:
+        event_parts = event.split()
+        event_type = re.match(EVENT_TYPE_PATTERN, event_parts[0]).group(1)
+        parsed_events.append(
+            {
+                "name": event_parts[0],
+                "event_type": event_type,
+                "source": population_labels[int(event_parts[1])],
+                "sink": population_labels[int(event_parts[2])],
+                "resized": event_parts[4] != "1",
+                "migration_matrix": event_parts[6],
+            }
+        )
+
+    return {
+        "num_demes": num_demes,
+        "ghost": "G" in population_labels,
+        "sample_sizes": sample_sizes,
+        "num_matrices": num_matrices,
+        "migration": num_matrices > 0,
+        "migration_varies_by_matrix": migration_varies_by_matrix,
+        "events": parsed_events,
+    }
+
+
+def get_canonical_model_hash(features):
+    # the hash covers the topology only, not random values such as admixture proportions
+    canonical_form = "|".join(
+        [
+            str(features["num_demes"]),
+            ",".join(features["sample_sizes"]),
+            "M" if features["migration"] else "",
+            "V" if features["migration_varies_by_matrix"] else "",
+        ]
+        + [
+            "{}:{}>{}:{}:{}".format(
+                event["event_type"],
+                event["source"],
+                event["sink"],
+                "R" if event["resized"] else "",
+                event["migration_matrix"],
+            )
+            for event in features["events"]
+        ]
+    )
+    return hashlib.sha1(canonical_form.encode()).hexdigest()
+
+
+def count_est_params(est_filepath):
+    # every line of the [PARAMETERS] section is a parameter fastsimcoal has to estimate
+    num_params = 0
+    in_params_section = False
+    with open(est_filepath, "r") as est_file:
+        for line in est_file:
+            if line.startswith("["):
+                in_params_section = line.startswith("[PARAMETERS]")
+            elif in_params_section and line.strip() and not line.startswith("//"):
+                num_params += 1
+    return num_params
+
+
+def read_model(model_dir, input_prefix):
+    with open(os.path.join(model_dir, f"{input_prefix}.tpl"), "r") as tpl_file:
+        tpl_lines = tpl_file.read().splitlines()
+    features = read_tpl_features(tpl_lines)
+    features["num_est_params"] = count_est_params(
+        os.path.join(model_dir, f"{input_prefix}.est")
+    )
+    features["canonical_hash"] = get_canonical_model_hash(features)
+    return features
+
+
+def add_model(connection, model_dir, input_prefix):
+    model_path = os.path.abspath(model_dir)
+    features = read_model(model_path, input_prefix)
+    events = features["events"]
+
+    # replace any earlier record of the same directory
+    connection.execute("DELETE FROM models WHERE path = ?", (model_path,))
+    cursor = connection.execute(
+        """INSERT INTO models (path, num_demes, ghost, migration, migration_varies_by_matrix, num_events,
+        event_order, admixture, bottleneck, num_est_params, canonical_hash) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+        (
+            model_path,
+            features["num_demes"],
+            features["ghost"],
+            features["migration"],
+            features["migration_varies_by_matrix"],
+            len(events),
+            " ".join(event["name"] for event in events),
+            any(event["event_type"] == "ADMIX" for event in events),
+            any(event["event_type"] == "BOT" for event in events),
+            features["num_est_params"],
+            features["canonical_hash"],
+        ),
+    )
+    connection.executemany(
+        "INSERT INTO events (model_id, position, event_type, source, sink) VALUES (?, ?, ?, ?, ?)",
+        [
+            (
+                cursor.lastrowid,
+                position,
+                event["event_type"],
+                event["source"],
+                event["sink"],
+            )
+            for position, event in enumerate(events, start=1)
+        ],
+    )
+    return features
+
+
+def import_output_dir(catalog_filepath, output_dir, input_prefix):
+    # back-fill the catalog from models that were generated before it existed
+    connection = open_catalog(catalog_filepath)
+    # bulk import, the tpl/est files remain the source of truth
+    connection.execute("PRAGMA synchronous = OFF")
+    num_imported = 0
+    with connection:
+        for tpl_filepath in glob.glob(
+            os.path.join(output_dir, "random_model_*", f"{input_prefix}.tpl")
+        ):
+            add_model(connection, os.path.dirname(tpl_filepath), input_prefix)
+            num_imported += 1
+    connection.close()
+    return num_imported
+
+
+def query_models(
+    catalog_filepath,
+    ghost=None,
+    migration=None,
+    migration_varies_by_matrix=None,
+    admixture=None,
+    bottleneck=None,
+    admix_into=None,
+    admix_from=None,
+    bottleneck_in=None,
+    min_params=None,
+    max_params=None,
+    canonical_hash=None,
+):
+    conditions = []
+    values = []
+
+    # define nested functions
+    def add_condition(condition, value):
+        if value is not None:
+            conditions.append(condition)
+            values.append(value)
+
+    def add_event_condition(event_type, column, population):
+        if population is not None:
+            conditions.append(
+                f"id IN (SELECT model_id FROM events WHERE event_type = ? AND {column} = ?)"
+            )
+            values.extend([event_type, get_population_id(str(population))])
+
+    add_condition("ghost = ?", ghost)
+    add_condition("migration = ?", migration)
+    add_condition("migration_varies_by_matrix = ?", migration_varies_by_matrix)
+    add_condition("admixture = ?", admixture)
+    add_condition("bottleneck = ?", bottleneck)
+    add_condition("num_est_params >= ?", min_params)
+    add_condition("num_est_params <= ?", max_params)
+    add_condition("canonical_hash = ?", canonical_hash)
+    # fastsimcoal events run backwards in time: lineages move from the source deme to the sink deme,
+    # so forwards in time the sink admixes into the source
+    add_event_condition("ADMIX", "source", admix_into)
+    add_event_condition("ADMIX", "sink", admix_from)
+    add_event_condition("BOT", "source", bottleneck_in)
+
+    query = "SELECT path FROM models"
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += " ORDER BY id"
+
+    connection = open_catalog(catalog_filepath)
+    paths = [row[0] for row in connection.execute(query, values)]
+    connection.close()
+    return paths
+
+
+def main(arguments):
+    parser = argparse.ArgumentParser(description="Query or back-fill a model catalog")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = subparsers.add_parser(
+        "import", help="add existing random_model_* directories to the catalog"
+    )
+    import_parser.add_argument("catalog")
+    import_parser.add_argument("output_dir")
+    import_parser.add_argument("input_prefix")
+
+    query_parser = subparsers.add_parser("query", help="print matching model paths")
+    query_parser.add_argument("catalog")
+    for feature in [
+        "ghost",
+        "migration",
+        "migration-varies-by-matrix",
+        "admixture",
+        "bottleneck",
+    ]:
+        query_parser.add_argument(
+            f"--{feature}", action=argparse.BooleanOptionalAction, default=None
+        )
+    query_parser.add_argument("--admix-into", help="population receiving admixture")
+    query_parser.add_argument("--admix-from", help="population contributing admixture")
+    query_parser.add_argument("--bottleneck-in", help="bottlenecked population")
+    query_parser.add_argument("--min-params", type=int)
+    query_parser.add_argument("--max-params", type=int)
+    query_parser.add_argument("--canonical-hash")
+
+    args = parser.parse_args(arguments)
+
+    if args.command == "import":
+        num_imported = import_output_dir(
+            args.catalog, args.output_dir, args.input_prefix
+        )
+        print(f"Imported {num_imported} models into {args.catalog}")
+    else:
+        if not os.path.exists(args.catalog):
+            print(f"Error: catalog not found: {args.catalog}")
+            sys.exit(1)
+        for path in query_models(
+            args.catalog,
+            ghost=args.ghost,
+            migration=args.migration,
+            migration_varies_by_matrix=args.migration_varies_by_matrix,
+            admixture=args.admixture,
+            bottleneck=args.bottleneck,
+            admix_into=args.admix_into,
+            admix_from=args.admix_from,
+            bottleneck_in=args.bottleneck_in,
+            min_params=args.min_params,
+            max_params=args.max_params,
+            canonical_hash=args.canonical_hash,
+        ):
+            print(path)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,37 @@
+"""
+A HyperLogLog sketch over canonical model hashes, to estimate the number of distinct topologies drawn so far
+in fixed memory (2^precision one-byte registers, e.g. 16 KB with a standard error of ~0.8% at precision 14)
+"""
+
+import math
+
+
+def new_sketch(precision=14):
+    if not 4 <= precision <= 18:
+        raise ValueError(f"Unsupported sketch precision: {precision}")
+    return bytearray(2**precision)
+
+
+def add_to_sketch(sketch, canonical_hash):
+    # the first 64 bits of the (hex) hash: the top bits pick a register, the rest give the rank of its first 1 bit
+    precision = len(sketch).bit_length() - 1
+    hash_bits = int(canonical_hash[:16], 16)
+    register = hash_bits >> (64 - precision)
+    remaining_bits = hash_bits & ((1 << (64 - precision)) - 1)
+    rank = (64 - precision) - remaining_bits.bit_length() + 1
+    if rank > sketch[register]:
+        sketch[register] = rank
+        return True
+    return False
+
+
+def estimate_distinct(sketch):
+    num_registers = len(sketch)
+    alpha = 0.7213 / (1 + 1.079 / num_registers)
+    estimate = alpha * num_registers**2 / sum(2.0**-rank for rank in sketch)
+
+    # linear counting is more accurate while many registers are still empty
+    num_empty_registers = sketch.count(0)
+    if estimate <= 2.5 * num_registers and num_empty_registers:
+        estimate = num_registers * math.log(num_registers / num_empty_registers)
+    return estimate